@@ -1,46 +1,31 @@
 #!/usr/bin/env python3
 """
-Create print-ready HTML sheets with QR codes (6-up per page)
+Create print-ready QR code sheets (6-up per page)
 Layout: 2 columns x 3 rows on 8.5x11" paper with 0.5" margins
+
+Cards come from coffees.json, one per copy ("copies": 6 prints six Honduras
+cards). Copies of a coffee are packed onto the same page where that does
+not cost an extra sheet. Pages are streamed to the output file one at a
+time, so memory stays flat however many copies are printed.
+
+    python3 create_print_sheets.py                     # qr_print_sheets.html
+    python3 create_print_sheets.py --pdf qr_sheets.pdf # print-ready PDF too
+
+The PDF embeds each QR image once and reuses it for every copy.
 """
+import argparse
 import os
-from pathlib import Path
-
-# Coffee types in order
-coffees = [
-    ("Brazil", "brazil"),
-    ("Brazil Decaf", "brazil-decaf"),
-    ("Brazil Mantiqueira de Minas", "brazil-mantiqueira"),
-    ("Burundi", "burundi"),
-    ("Colombia", "colombia"),
-    ("Colombia Decaf", "colombia-decaf"),
-    ("Costa Rica", "costa-rica"),
-    ("Dark Roast Decaf", "dark-roast-decaf"),
-    ("Early Winter Blend", "early-winter-blend"),
-    ("Ethiopia Decaf", "ethiopia-decaf"),
-    ("Ethiopia Guji", "ethiopia-guji"),
-    ("French Espresso Colombia", "french-espresso-colombia"),
-    ("French Espresso Guatemala", "french-espresso-guatemala"),
-    ("French Espresso PNG", "french-espresso-png"),
-    ("Guatemala", "guatemala"),
-    ("Honduras", "honduras"),
-    ("Kenya AA", "kenya-aa"),
-    ("Kona 100%", "kona-100"),
-    ("Mexico", "mexico"),
-    ("Mexico Decaf", "mexico-decaf"),
-    ("Mocha Java", "mocha-java"),
-    ("Nicaragua", "nicaragua"),
-    ("PNG", "png"),
-    ("Scandinavian Blend", "scandinavian-blend"),
-    ("Sulawesi", "sulawesi"),
-    ("Sumatra", "sumatra"),
-    ("Sumatra Dark Roast", "sumatra-dark"),
-    ("Sumatra Decaf", "sumatra-decaf"),
-    ("Tanzania PB", "tanzania-pb"),
-    ("Village Blend", "village"),
-]
+import sys
+import zlib
+from html import escape
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "python-legacy"))
+
+from coffee_catalog import CATALOG_FILE, load_catalog  # noqa: E402
 
-html = """<!DOCTYPE html>
+CARDS_PER_PAGE = 6
+
+HTML_HEAD = """<!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
@@ -134,48 +119,274 @@ html = """<!DOCTYPE html>
 <body>
 """
 
-# Group coffees into pages of 6
-pages = [coffees[i:i+6] for i in range(0, len(coffees), 6)]
+HTML_TAIL = """</body>
+</html>
+"""
+
+
+def pack_pages(coffees: list[dict], per_page: int = CARDS_PER_PAGE) -> list[list[dict]]:
+    """Cards per page, keeping each coffee's copies together when it costs no paper.
+
+    First-fit decreasing over the copy groups; a group is split across the
+    free slots of earlier pages rather than starting a page it cannot fill.
+    """
+    order = {c["slug"]: i for i, c in enumerate(coffees)}
+    pages: list[list[dict]] = []
+    groups = []
+    for coffee in coffees:
+        copies = coffee["copies"]
+        # Whole pages of one coffee first
+        while copies >= per_page:
+            pages.append([coffee] * per_page)
+            copies -= per_page
+        if copies:
+            groups.append((copies, coffee))
+    groups.sort(key=lambda g: (-g[0], order[g[1]["slug"]]))
 
-for page_num, page_coffees in enumerate(pages):
-    html += f'<div class="page">\n'
+    open_pages: list[list[dict]] = []
+    for copies, coffee in groups:
+        target = next((p for p in open_pages if per_page - len(p) >= copies), None)
+        if target is not None:
+            target.extend([coffee] * copies)
+            continue
+        free = sum(per_page - len(p) for p in open_pages)
+        if free < copies:
+            open_pages.append([coffee] * copies)
+            continue
+        for page in sorted(open_pages, key=len):
+            take = min(copies, per_page - len(page))
+            page.extend([coffee] * take)
+            copies -= take
+            if not copies:
+                break
 
-    for display_name, file_name in page_coffees:
-        html += f'''    <div class="qr-card">
-        <div class="coffee-name">{display_name}</div>
-        <img src="qr_codes/{file_name}.png" alt="{display_name}" class="qr-image">
+    pages.extend(open_pages)
+    for page in pages:
+        page.sort(key=lambda c: order[c["slug"]])
+    pages.sort(key=lambda p: order[p[0]["slug"]])
+    return pages
+
+
+def write_html(pages: list[list[dict]], output: str, qr_dir: str):
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(HTML_HEAD)
+        for page in pages:
+            f.write('<div class="page">\n')
+            for coffee in page:
+                name = escape(coffee["name"])
+                src = escape(f"{qr_dir}/{coffee['slug']}.png")
+                f.write(
+                    f'''    <div class="qr-card">
+        <div class="coffee-name">{name}</div>
+        <img src="{src}" alt="{name}" class="qr-image">
     </div>
 '''
+                )
+            # Fill remaining slots with empty cards if needed
+            for _ in range(CARDS_PER_PAGE - len(page)):
+                f.write('    <div class="qr-card"></div>\n')
+            f.write("</div>\n\n")
+        f.write(HTML_TAIL)
+
 
-    # Fill remaining slots with empty cards if needed
-    remaining = 6 - len(page_coffees)
-    for _ in range(remaining):
-        html += '    <div class="qr-card"></div>\n'
+# Helvetica-Bold advance widths (1/1000 em) for ASCII 32..126, from the AFM
+_HELVETICA_BOLD_WIDTHS = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
 
-    html += '</div>\n\n'
+# Letter page in points, mirroring the HTML layout
+PAGE_W, PAGE_H = 612, 792
+MARGIN, GAP, CARD_PAD = 36, 14.4, 21.6
+CARD_W = (PAGE_W - 2 * MARGIN - GAP) / 2
+CARD_H = (PAGE_H - 2 * MARGIN - 2 * GAP) / 3
+QR_SIZE = 144
+NAME_SIZE, NAME_LEADING, NAME_GAP = 26, 1.1, 14.4
+NAME_RGB = (0x2B / 255, 0x17 / 255, 0x12 / 255)
+
+
+def _text_width(text: str, size: float) -> float:
+    return sum(
+        _HELVETICA_BOLD_WIDTHS[ord(ch) - 32] if 32 <= ord(ch) <= 126 else 556 for ch in text
+    ) * size / 1000
+
+
+def _wrap(text: str, size: float, width: float) -> list[str]:
+    lines, line = [], ""
+    for word in text.split():
+        candidate = f"{line} {word}" if line else word
+        if line and _text_width(candidate, size) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    return lines + [line] if line else lines
+
+
+def _pdf_string(text: str) -> str:
+    raw = text.encode("cp1252", errors="replace").decode("latin-1")
+    return "(" + raw.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+class PDFWriter:
+    """Just enough PDF: objects are written as they come, the xref at the end"""
+
+    def __init__(self, path: str):
+        self.f = open(path, "wb")
+        self.offsets: dict[int, int] = {}
+        self.next_id = 1
+        self.f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def reserve(self) -> int:
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def write(self, obj_id: int, body: str, stream: bytes = None):
+        self.offsets[obj_id] = self.f.tell()
+        self.f.write(f"{obj_id} 0 obj\n{body}\n".encode("latin-1"))
+        if stream is not None:
+            self.f.write(b"stream\n" + stream + b"\nendstream\n")
+        self.f.write(b"endobj\n")
+
+    def close(self, root_id: int):
+        xref = self.f.tell()
+        count = self.next_id
+        self.f.write(f"xref\n0 {count}\n0000000000 65535 f \n".encode("ascii"))
+        for obj_id in range(1, count):
+            self.f.write(f"{self.offsets[obj_id]:010d} 00000 n \n".encode("ascii"))
+        self.f.write(f"trailer\n<< /Size {count} /Root {root_id} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii"))
+        self.f.close()
+
+
+def _embed_qr(pdf: PDFWriter, path: str) -> int:
+    from PIL import Image
+
+    with Image.open(path) as img:
+        gray = img.convert("L")
+        data = zlib.compress(gray.tobytes(), 9)
+        width, height = gray.size
+    obj_id = pdf.reserve()
+    pdf.write(
+        obj_id,
+        f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+        f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length {len(data)} >>",
+        data,
+    )
+    return obj_id
+
+
+def _card_ops(coffee: dict, slot: int, image_name: str) -> list[str]:
+    col, row = slot % 2, slot // 2
+    x0 = MARGIN + col * (CARD_W + GAP)
+    top = PAGE_H - MARGIN - row * (CARD_H + GAP)
+
+    size = NAME_SIZE
+    lines = _wrap(coffee["name"], size, CARD_W - 2 * CARD_PAD)
+    # Long names shrink until they fit the card next to the QR code
+    while size > 12 and len(lines) * size * NAME_LEADING + NAME_GAP + QR_SIZE > CARD_H:
+        size -= 1
+        lines = _wrap(coffee["name"], size, CARD_W - 2 * CARD_PAD)
+    leading = size * NAME_LEADING
+    block = len(lines) * leading + NAME_GAP + QR_SIZE
+    y = top - (CARD_H - block) / 2
+
+    ops = ["BT", f"/F1 {size} Tf", "%.4f %.4f %.4f rg" % NAME_RGB]
+    for line in lines:
+        baseline = y - (leading - size) / 2 - size * 0.75
+        x = x0 + (CARD_W - _text_width(line, size)) / 2
+        ops.append(f"1 0 0 1 {x:.2f} {baseline:.2f} Tm {_pdf_string(line)} Tj")
+        y -= leading
+    ops.append("ET")
+    qr_x = x0 + (CARD_W - QR_SIZE) / 2
+    qr_y = y - NAME_GAP - QR_SIZE
+    ops.append(f"q {QR_SIZE} 0 0 {QR_SIZE} {qr_x:.2f} {qr_y:.2f} cm /{image_name} Do Q")
+    return ops
+
+
+def write_pdf(pages: list[list[dict]], output: str, qr_dir: str):
+    pdf = PDFWriter(output)
+    catalog_id, pages_id, font_id = pdf.reserve(), pdf.reserve(), pdf.reserve()
+    pdf.write(
+        font_id,
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    )
+    images: dict[str, tuple[str, int]] = {}
+    page_ids = []
+    for page in pages:
+        ops = []
+        for slot, coffee in enumerate(page):
+            slug = coffee["slug"]
+            if slug not in images:
+                path = os.path.join(qr_dir, f"{slug}.png")
+                if not os.path.exists(path):
+                    raise SystemExit(f"Missing {path}; run ./generate_all_qr_codes.sh first")
+                images[slug] = (f"Im{len(images) + 1}", _embed_qr(pdf, path))
+            ops.extend(_card_ops(coffee, slot, images[slug][0]))
+        content = zlib.compress("\n".join(ops).encode("latin-1"))
+        content_id = pdf.reserve()
+        pdf.write(content_id, f"<< /Filter /FlateDecode /Length {len(content)} >>", content)
+
+        used = sorted({images[c["slug"]] for c in page}, key=lambda im: im[1])
+        xobjects = " ".join(f"/{name} {obj_id} 0 R" for name, obj_id in used)
+        page_id = pdf.reserve()
+        pdf.write(
+            page_id,
+            f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 {PAGE_W} {PAGE_H}] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> /XObject << {xobjects} >> >> "
+            f"/Contents {content_id} 0 R >>",
+        )
+        page_ids.append(page_id)
+
+    kids = " ".join(f"{p} 0 R" for p in page_ids)
+    pdf.write(pages_id, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>")
+    pdf.write(catalog_id, f"<< /Type /Catalog /Pages {pages_id} 0 R >>")
+    pdf.close(catalog_id)
+    return len(images)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create 6-up QR code print sheets from the coffee catalog.")
+    parser.add_argument("--catalog", default=CATALOG_FILE, help="Coffee catalog JSON")
+    parser.add_argument("--qr-dir", default="qr_codes", help="Directory of <slug>.png QR codes")
+    parser.add_argument("--output", default="qr_print_sheets.html", help="HTML output file")
+    parser.add_argument("--pdf", help="Also write a print-ready PDF here")
+    parser.add_argument("--only", default="", help="Comma-separated slugs to print")
+    parser.add_argument("--copies", type=int, help="Print this many copies of each coffee instead")
+    args = parser.parse_args()
+
+    coffees = load_catalog(args.catalog)
+    only = {s.strip() for s in args.only.split(",") if s.strip()}
+    if only:
+        coffees = [c for c in coffees if c["slug"] in only]
+    if args.copies is not None:
+        coffees = [{**c, "copies": max(0, args.copies)} for c in coffees]
+    pages = pack_pages([c for c in coffees if c["copies"]])
+    cards = sum(len(p) for p in pages)
+
+    write_html(pages, args.output, args.qr_dir)
+    print(f"✓ Created print-ready HTML: {args.output}")
+    print(f"  {len(pages)} pages total ({cards} QR cards of {len(coffees)} coffees)")
+    print(f"  Layout: 2 columns × 3 rows (6-up per page)")
+    if args.pdf:
+        embedded = write_pdf(pages, args.pdf, args.qr_dir)
+        print(f"✓ Created print-ready PDF: {args.pdf} ({embedded} QR images embedded once each)")
+    print("")
+    print("To print:")
+    print(f"  1. Open {args.pdf or args.output}" + ("" if args.pdf else " in your browser"))
+    print("  2. Print (Ctrl/Cmd+P)")
+    print("  3. Settings:")
+    print("     - Paper size: Letter (8.5 x 11 in)")
+    print("     - Margins: Default (0.5 in already included)" if not args.pdf else "     - Scale: 100% / Actual size")
+    if not args.pdf:
+        print("     - Background graphics: ON")
+    print("")
+    print("Copies per coffee come from the \"copies\" field in coffees.json.")
 
-html += """</body>
-</html>
-"""
 
-# Write HTML file
-output_file = "qr_print_sheets.html"
-with open(output_file, 'w') as f:
-    f.write(html)
-
-print(f"✓ Created print-ready HTML: {output_file}")
-print(f"  {len(pages)} pages total ({len(coffees)} QR codes)")
-print(f"  Layout: 2 columns × 3 rows (6-up per page)")
-print("")
-print("To print:")
-print("  1. Open qr_print_sheets.html in your browser")
-print("  2. Print (Ctrl/Cmd+P)")
-print("  3. Settings:")
-print("     - Paper size: Letter (8.5 x 11 in)")
-print("     - Margins: Default (0.5 in already included)")
-print("     - Background graphics: ON")
-print("")
-print("High-volume coffees to print multiple copies:")
-print("  - Honduras: 6 copies")
-print("  - Ethiopia Guji: 3 copies")
-print("  - Brazil, Brazil Decaf, Costa Rica, etc.: 2 copies each")
+if __name__ == "__main__":
+    main()
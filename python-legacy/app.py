@@ -1,35 +1,93 @@
+import time
+
+# Startup budget is measured from here
+_IMPORT_STARTED = time.perf_counter()
+
 import os
 import re
+import atexit
+import functools
 import json
-import time
-import base64
-from io import BytesIO
+import socket
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import imaplib
 import logging
 from typing import Optional, Tuple
-from email import message_from_bytes
 from email.header import decode_header
-from email.message import Message
-from datetime import datetime
+from email.parser import BytesHeaderParser
+from datetime import datetime, time as dtime, timedelta
 from zoneinfo import ZoneInfo
 
-import pillow_heif
-from PIL import Image, UnidentifiedImageError
-
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request, render_template
-from rapidfuzz import fuzz, process as rf_process
-from mistralai import Mistral
+from flask import Blueprint, Flask, abort, current_app, g, jsonify, request, render_template
+
+from bake_timeline import compile_timeline, slot_error, timeline_position
+from coffee_catalog import CATALOG_FILE, code_table, load_catalog
+from imap_client import (
+    IMAP_SECONDS,
+    IMAPSession,
+    decode_section,
+    fetch_item,
+    parse_bodystructure,
+    parse_fetch_response,
+)
+from jobs import OrderedJobQueue
+from locations import (
+    DEFAULT_LOCATION,
+    Location,
+    load_location_config,
+    route_email,
+    store_path,
+)
+from menu_index import MenuIndex, as_menu_index, get_menu_index
+from metrics import (
+    BYTES_BUCKETS,
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    FAST_BUCKETS,
+    REGISTRY,
+    SLOW_BUCKETS,
+)
+from mime_parts import decode_part, is_pdf, plan_parts, scan_parts
+from ocr_cache import OCR_CACHE_DIR, OCRCache
+from roast_history import RoastHistory
+from state_store import create_store
 
 load_dotenv()
-pillow_heif.register_heif_opener()
 
 logging.basicConfig(
     level=logging.INFO, format="[%(asctime)s] %(levelname)s %(message)s"
 )
 logger = logging.getLogger("village-roaster")
 
+REQUEST_SECONDS = REGISTRY.histogram(
+    "sign_request_seconds", "HTTP request latency by route", ("route", "method", "status")
+)
+LOCK_WAIT_SECONDS = REGISTRY.histogram(
+    "sign_lock_wait_seconds", "Time spent waiting for a location's state lock", ("mode",), FAST_BUCKETS
+)
+SAVE_STATE_SECONDS = REGISTRY.histogram(
+    "sign_save_state_seconds", "Duration of save_state()", ("backend",), FAST_BUCKETS
+)
+IMAGE_NORMALIZE_SECONDS = REGISTRY.histogram(
+    "sign_image_normalize_seconds", "Time to normalize an image for OCR"
+)
+IMAGE_BYTES = REGISTRY.histogram(
+    "sign_image_bytes", "Image size before and after normalization", ("stage",), BYTES_BUCKETS
+)
+OCR_SECONDS = REGISTRY.histogram("sign_ocr_seconds", "OCR API latency", ("outcome",), SLOW_BUCKETS)
+OCR_FAILURES = REGISTRY.counter("sign_ocr_failures", "OCR calls that failed after retries")
+FUZZY_MATCH_SECONDS = REGISTRY.histogram(
+    "sign_fuzzy_match_seconds", "Time to match OCR candidates against the menu", (), FAST_BUCKETS
+)
+STATE_POLLS = REGISTRY.counter("sign_state_polls", "/api/state requests", ("location",))
+STATE_NOT_MODIFIED = REGISTRY.counter(
+    "sign_state_not_modified", "/api/state requests answered with 304", ("location",)
+)
+CACHE_LOOKUPS = REGISTRY.counter("sign_cache_lookups", "Cache lookups by cache and result", ("cache", "result"))
+STARTUP_SECONDS = REGISTRY.histogram("sign_startup_seconds", "Time to get a worker ready, by phase", ("phase",))
+
 APP_TZ = os.getenv("APP_TZ", "America/Denver")
 RESET_HOUR = int(os.getenv("RESET_HOUR", "6"))
 SHIFT_START_HOUR = int(os.getenv("SHIFT_START_HOUR", "7"))
@@ -44,62 +102,213 @@ ALLOWED_SENDERS = [
 ]
 EMAIL_SUBJECT_TRIGGER = os.getenv("EMAIL_SUBJECT_TRIGGER", "").strip()
 EMAIL_SUBJECT_PASSCODE = os.getenv("EMAIL_SUBJECT_PASSCODE", "").strip()
+IMAP_HOST = os.getenv("IMAP_HOST", "imap.gmail.com").strip()
+IMAP_PORT = int(os.getenv("IMAP_PORT", "993"))
+IMAP_SSL = os.getenv("IMAP_SSL", "1").strip().lower() not in ("0", "false", "no", "off")
+IMAP_IDLE_SECONDS = int(os.getenv("IMAP_IDLE_SECONDS", "600"))
+IMAP_FETCH_BATCH = int(os.getenv("IMAP_FETCH_BATCH", "50"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", "50"))
+# How long stop_workers lets the email loop and queued ingest jobs finish before giving up on them
+INGEST_DRAIN_SECONDS = float(os.getenv("INGEST_DRAIN_SECONDS", "20"))
+PLAN_MAX_ATTACHMENTS = int(os.getenv("PLAN_MAX_ATTACHMENTS", "6"))
+OCR_PAGE_WORKERS = int(os.getenv("OCR_PAGE_WORKERS", "4"))
 
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY", "").strip()
 MENU_ITEMS = os.getenv("MENU_ITEMS", "").strip()
 MENU_ITEMS_FILE = os.getenv("MENU_ITEMS_FILE", "").strip()
+LOCATIONS = os.getenv("LOCATIONS", "").strip()
+LOCATIONS_FILE = os.getenv("LOCATIONS_FILE", "").strip()
 ROASTS_MAX = int(os.getenv("ROASTS_MAX", "30"))
-
-app = Flask(__name__)
-lock = threading.Lock()
+COFFEE_CATALOG_FILE = os.getenv("COFFEE_CATALOG_FILE", CATALOG_FILE).strip()
+# Reject roast names that are not in the catalog (when it is present)
+ROAST_CATALOG_ONLY = os.getenv("ROAST_CATALOG_ONLY", "1").strip().lower() not in ("0", "false", "no", "off")
+STATE_BACKEND = os.getenv("STATE_BACKEND", "json").strip().lower()
+STATE_NOTIFY_SECONDS = float(os.getenv("STATE_NOTIFY_SECONDS", "0.5"))
+INGEST_LEASE_SECONDS = int(os.getenv("INGEST_LEASE_SECONDS", "90"))
+INGEST_ENABLED = os.getenv("INGEST_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off")
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "500"))
+# Set again by start_workers(), which runs in the forked worker
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+STATE_FSYNC_SECONDS = float(os.getenv("STATE_FSYNC_SECONDS", "0.5"))
+STATE_COMPACT_RECORDS = int(os.getenv("STATE_COMPACT_RECORDS", "500"))
+SSE_HEARTBEAT_SECONDS = int(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_REPLAY_EVENTS = int(os.getenv("SSE_REPLAY_EVENTS", "100"))
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "3000"))
+
+bp = Blueprint("sign", __name__)
 
 STATE_FILE = os.path.join(os.path.dirname(__file__), "state.json")
+STATE_DB = os.getenv("STATE_DB", os.path.join(os.path.dirname(__file__), "state.db")).strip()
+# Append-only roast log, one per location; empty keeps history in memory only
+ROAST_HISTORY_FILE = os.getenv(
+    "ROAST_HISTORY_FILE", os.path.join(os.path.dirname(__file__), "roasts.log")
+).strip()
+ROAST_HISTORY_MAX_EVENTS = int(os.getenv("ROAST_HISTORY_MAX_EVENTS", "5000"))
+
+mail_state = {"last_uid": None, "uidvalidity": None}
+
+
+def _create_location(name: str, config: dict) -> Location:
+    loc_store = create_store(
+        STATE_BACKEND,
+        store_path(STATE_FILE, name),
+        store_path(STATE_DB, name),
+        fsync_seconds=STATE_FSYNC_SECONDS,
+        compact_records=STATE_COMPACT_RECORDS,
+        notify_seconds=STATE_NOTIFY_SECONDS,
+    )
+    history = RoastHistory(
+        store_path(ROAST_HISTORY_FILE, name) if ROAST_HISTORY_FILE else "",
+        APP_ZONE,
+        ring_size=ROASTS_MAX,
+    )
+    return Location(name, loc_store, config, backlog=SSE_REPLAY_EVENTS, history=history)
+
+
+# Filled in by start_workers(). The default location backs the unprefixed
+# routes and owns the mailbox cursor (and the ingest lease).
+locations: dict = {}
+default_location: Optional[Location] = None
 
-state = {
-    "date": None,
-    "roast_current": "",
-    "roasts_today": [],
-    "bake_items": [],
-    "bake_source": "",
-    "updated_at": None,
-}
-mail_state = {"last_uid": None}
+
+# Short code -> coffee name and lowercased name -> coffee name, from the catalog
+roast_codes: dict = {}
+roast_names: dict = {}
+
+
+def load_roast_catalog():
+    """Build the roast lookup tables once; /r/<code> and api_roast only do dict lookups"""
+    try:
+        coffees = load_catalog(COFFEE_CATALOG_FILE)
+    except (OSError, ValueError) as exc:
+        logger.warning("No coffee catalog (%s); short roast codes disabled", exc)
+        coffees = []
+    roast_codes.clear()
+    roast_codes.update(code_table(coffees))
+    roast_names.clear()
+    roast_names.update({c["name"].lower(): c["name"] for c in coffees})
+    logger.info("Loaded %d roast codes from %s", len(roast_codes), COFFEE_CATALOG_FILE)
 
 
 def load_state():
-    """Load state from JSON file if it exists"""
-    global state, mail_state
-    if os.path.exists(STATE_FILE):
+    """Load persisted state for every location from the configured store"""
+    for loc in locations.values():
         try:
-            with open(STATE_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            if "state" in data:
-                state.update(data["state"])
-                logger.info("Loaded state from %s: %d bake items, %d roasts",
-                           STATE_FILE, len(state.get("bake_items", [])), len(state.get("roasts_today", [])))
-            if "mail_state" in data:
+            data = loc.store.load()
+            if data.get("state"):
+                loc.state.update(data["state"])
+                logger.info("Loaded state for %s (%s): %d bake items, %d roasts",
+                           loc.name, STATE_BACKEND, len(loc.state.get("bake_items", [])),
+                           len(loc.state.get("roasts_today", [])))
+            if loc is default_location and data.get("mail_state"):
                 mail_state.update(data["mail_state"])
                 logger.info("Loaded mail state: last_uid=%s", mail_state.get("last_uid"))
         except Exception:
-            logger.exception("Failed to load state from %s", STATE_FILE)
+            logger.exception("Failed to load state for %s (%s)", loc.name, STATE_BACKEND)
 
 
-def save_state():
-    """Save state to JSON file"""
+def save_state(loc: Optional[Location] = None):
+    """Persist whatever changed since the last save; caller must hold the location's transaction"""
+    loc = loc or default_location
     try:
-        with open(STATE_FILE, "w", encoding="utf-8") as f:
-            json.dump({"state": state, "mail_state": mail_state}, f, indent=2)
-        logger.debug("Saved state to %s", STATE_FILE)
+        with SAVE_STATE_SECONDS.time(backend=STATE_BACKEND):
+            loc.store.save()
     except Exception:
-        logger.exception("Failed to save state to %s", STATE_FILE)
+        logger.exception("Failed to save state for %s (%s)", loc.name, STATE_BACKEND)
+
+
+@contextmanager
+def read_lock(loc: Location):
+    """loc.lock, recording how long we waited for it"""
+    start = time.perf_counter()
+    with loc.lock:
+        LOCK_WAIT_SECONDS.observe(time.perf_counter() - start, mode="read")
+        yield
 
 
-# Load state on startup
-load_state()
+@contextmanager
+def write_transaction(loc: Location):
+    """loc.store.transaction(), recording how long we waited to enter it"""
+    start = time.perf_counter()
+    with loc.store.transaction():
+        LOCK_WAIT_SECONDS.observe(time.perf_counter() - start, mode="write")
+        yield
+
+
+# Fields pushed to /api/stream listeners for each kind of change; "reset"
+# sends the full state
+CHANGE_FIELDS = {
+    "roast": ("roast_current", "roasts_today", "updated_at", "version"),
+    "bake": ("bake_items", "bake_current_index", "bake_next_change", "updated_at", "version"),
+    "index": ("bake_current_index", "bake_next_change"),
+}
+
+
+def bump_version(loc: Location):
+    """Mark state as changed; caller must hold loc.lock"""
+    loc.state["version"] = int(loc.state.get("version") or 0) + 1
+
+
+def bake_window(loc: Location) -> dict:
+    """Current bake index and next change for a location; caller must hold loc.lock"""
+    return compute_bake_window(loc.state["bake_items"], loc.state.get("bake_timeline"))
+
+
+def state_payload(loc: Location, window: dict) -> dict:
+    s = loc.state
+    return {
+        "date": s["date"],
+        "roast_current": s["roast_current"],
+        "roasts_today": s["roasts_today"],
+        "bake_items": s["bake_items"],
+        "bake_current_index": window["current_index"],
+        "bake_next_change": window["next_change"],
+        "updated_at": s["updated_at"],
+        "version": s["version"],
+    }
+
+
+def publish_change(loc: Location, kind: str, bump: bool = True):
+    """Record a state change and push it to the location's stream listeners; caller must hold loc.lock"""
+    if kind != "index" and bump:
+        bump_version(loc)
+    window = bake_window(loc)
+    loc.last_bake_index["value"] = window["current_index"]
+    if kind != "roast":
+        # The plan (or the day) changed; the index loop may need to wake sooner
+        bake_timeline_changed.set()
+    payload = state_payload(loc, window)
+    fields = CHANGE_FIELDS.get(kind)
+    if fields:
+        payload = {k: payload[k] for k in fields}
+    loc.broadcaster.publish(kind, payload)
+
+
+ROAST_KEYS = {"roast_current", "roasts_today"}
+bake_timeline_changed = threading.Event()
+
+
+def on_store_change(loc: Location, keys: set):
+    """Another worker committed a change; tell this worker's stream listeners"""
+    if "date" in keys or ("bake_items" in keys and keys & ROAST_KEYS):
+        kind = "reset"
+    elif "bake_items" in keys:
+        kind = "bake"
+    elif keys & ROAST_KEYS:
+        kind = "roast"
+    else:
+        kind = "reset"
+    logger.debug("State for %s changed in another worker (%s): %s", loc.name, kind, sorted(keys))
+    with loc.lock:
+        publish_change(loc, kind, bump=False)
+
+
+APP_ZONE = ZoneInfo(APP_TZ)
 
 
 def now_local():
-    return datetime.now(tz=ZoneInfo(APP_TZ))
+    return datetime.now(tz=APP_ZONE)
 
 
 def today_key(dt=None):
@@ -112,46 +321,66 @@ def iso(dt=None):
     return dt.isoformat()
 
 
-def ensure_daily_reset():
-    with lock:
+def _reset_due(loc: Location, local) -> bool:
+    return loc.state["date"] != today_key(local) and local.hour >= RESET_HOUR
+
+
+def next_reset_after(local: datetime) -> datetime:
+    """First RESET_HOUR wall-clock boundary after local, in APP_TZ"""
+    day = local.date()
+    if local.hour >= RESET_HOUR:
+        day += timedelta(days=1)
+    # Built from the wall clock, so the boundary stays at RESET_HOUR across DST changes
+    return datetime.combine(day, dtime(RESET_HOUR), tzinfo=APP_ZONE)
+
+
+def ensure_daily_reset(loc: Optional[Location] = None):
+    """Reset the location's day once its cached deadline has passed.
+
+    Until then this is a lock-free integer comparison, cheap enough for every
+    request; rollover_loop() normally fires the reset right at the deadline.
+    """
+    loc = loc or default_location
+    if time.time() < loc.reset_deadline:
+        return
+    with write_transaction(loc):
+        # Another thread may have handled this deadline already
+        if time.time() < loc.reset_deadline:
+            return
         local = now_local()
-        tkey = today_key(local)
-        logger.info("ensure_daily_reset: state[date]=%s, today=%s, hour=%d, reset_hour=%d",
-                   state["date"], tkey, local.hour, RESET_HOUR)
-        if state["date"] != tkey and local.hour >= RESET_HOUR:
-            logger.warning("RESETTING STATE! Old date: %s, New date: %s", state["date"], tkey)
-            state.update(
+        # Another worker may have reset already
+        if _reset_due(loc, local):
+            tkey = today_key(local)
+            logger.warning("RESETTING STATE for %s! Old date: %s, New date: %s",
+                           loc.name, loc.state["date"], tkey)
+            loc.state.update(
                 {
                     "date": tkey,
                     "roast_current": "",
                     "roasts_today": [],
                     "bake_items": [],
+                    "bake_timeline": {},
                     "bake_source": "",
                     "updated_at": iso(local),
                 }
             )
-            save_state()
+            publish_change(loc, "reset")
+            save_state(loc)
+        loc.reset_deadline = int(next_reset_after(local).timestamp())
+        logger.debug("Next reset for %s at %s", loc.name, datetime.fromtimestamp(loc.reset_deadline, APP_ZONE))
 
 
-def load_menu_items():
-    if MENU_ITEMS:
-        try:
-            arr = json.loads(MENU_ITEMS)
-            if isinstance(arr, list):
-                return [str(x).strip() for x in arr if str(x).strip()]
-        except Exception:
-            pass
+def load_menu_index(loc: Optional[Location] = None) -> MenuIndex:
+    """The location's own menu, falling back to MENU_ITEMS / MENU_ITEMS_FILE"""
+    if loc is not None and (loc.menu_items or loc.menu_file):
+        index = get_menu_index(loc.menu_items, loc.menu_file)
+        if len(index):
+            return index
+    return get_menu_index(MENU_ITEMS, MENU_ITEMS_FILE)
 
-    if MENU_ITEMS_FILE and os.path.exists(MENU_ITEMS_FILE):
-        try:
-            with open(MENU_ITEMS_FILE, "r", encoding="utf-8") as f:
-                arr = json.load(f)
-            if isinstance(arr, list):
-                return [str(x).strip() for x in arr if str(x).strip()]
-        except Exception:
-            pass
 
-    return []
+def load_menu_items(loc: Optional[Location] = None):
+    return load_menu_index(loc).names
 
 
 def normalize_text(s: str) -> str:
@@ -187,76 +416,77 @@ def split_candidate_lines(ocr_text: str) -> list[str]:
     return final
 
 
-def fuzzy_match_to_menu(candidates: list[str], menu: list[str]) -> list[str]:
+def fuzzy_match_scored(candidates: list[str], menu) -> list[tuple[str, float]]:
+    """Like fuzzy_match_to_menu but keeps each match's score"""
     if not candidates:
         return []
-    if not menu:
-        return candidates
-
-    matched = []
-    used = set()
-    for c in candidates:
-        best = rf_process.extractOne(c, menu, scorer=fuzz.WRatio)
-        if not best:
-            continue
-        name, score, _ = best
-        if score < 80:
-            continue
-        key = name.lower()
-        if key in used:
-            continue
-        used.add(key)
-        matched.append(name)
-    return matched
+    index = as_menu_index(menu)
+    if not len(index):
+        return [(c, 100.0) for c in candidates]
+    with FUZZY_MATCH_SECONDS.time():
+        return index.match(candidates)
 
 
-def compute_bake_window(items: list[str]) -> dict:
-    local = now_local()
-    if not items:
-        return {"current_index": 0}
+def fuzzy_match_to_menu(candidates: list[str], menu) -> list[str]:
+    return [name for name, _ in fuzzy_match_scored(candidates, menu)]
 
-    start = local.replace(hour=SHIFT_START_HOUR, minute=0, second=0, microsecond=0)
-    end = local.replace(hour=SHIFT_END_HOUR, minute=0, second=0, microsecond=0)
 
-    if local <= start:
-        return {"current_index": 0}
-    if local >= end:
-        return {"current_index": max(0, len(items) - 3)}
+def compile_bake_timeline(items: list, loc: Optional[Location] = None, day=None) -> dict:
+    """Compile a plan into per-item start times for the shift on day (default today).
 
-    total_minutes = int((end - start).total_seconds() // 60)
-    elapsed = int((local - start).total_seconds() // 60)
+    Items are names or {"name", "minutes"?, "weight"?, "at"?} dicts; fields the
+    item leaves out come from its menu entry.
+    """
+    index = load_menu_index(loc)
+    slots = []
+    for item in items:
+        spec = item if isinstance(item, dict) else {"name": item}
+        entry = index.entry(str(spec.get("name", "")))
+        slots.append({k: spec.get(k, entry.get(k)) for k in ("minutes", "weight", "at")})
+    day = day or now_local().date()
+    return compile_timeline(slots, day, SHIFT_START_HOUR, SHIFT_END_HOUR, APP_ZONE)
 
-    idx = int((elapsed / max(1, total_minutes)) * max(1, len(items)))
-    idx = min(idx, max(0, len(items) - 1))
-    return {"current_index": idx}
+
+def compute_bake_window(items: list[str], timeline: Optional[dict] = None) -> dict:
+    """Current index into items and the epoch second it next changes (or None)"""
+    if not items:
+        return {"current_index": 0, "next_change": None}
+    local = now_local()
+    if not timeline or timeline.get("date") != local.date().isoformat():
+        # No compiled plan for today (older state, or the plan is from
+        # yesterday and not reset yet); fall back to an even split
+        timeline = compile_timeline([{}] * len(items), local.date(), SHIFT_START_HOUR, SHIFT_END_HOUR, APP_ZONE)
+    idx, next_change = timeline_position(timeline, len(items), local.timestamp())
+    return {"current_index": idx, "next_change": next_change}
 
 
 def normalize_image_bytes(image_bytes: bytes, filename: str = "") -> bytes:
     if not image_bytes:
         return image_bytes
+    # PIL and pillow_heif load on first use, so web-only workers never pay for them
+    from PIL import UnidentifiedImageError
+    from image_pipeline import prepare_ocr_image
+
     try:
-        with Image.open(BytesIO(image_bytes)) as img:
-            logger.info(
-                "Loaded image %s (%s %dx%d %s)",
-                filename or "<unnamed>",
-                (img.format or "unknown"),
-                img.width,
-                img.height,
-                img.mode,
-            )
-            if img.mode not in ("RGB", "RGBA"):
-                img = img.convert("RGB")
-            elif img.mode == "RGBA":
-                img = img.convert("RGB")
-            buffer = BytesIO()
-            img.save(buffer, format="JPEG", quality=90)
-            normalized = buffer.getvalue()
-            logger.info(
-                "Normalized image %s to JPEG (%d bytes)",
-                filename or "<unnamed>",
-                len(normalized),
-            )
-            return normalized
+        normalized, info = prepare_ocr_image(image_bytes)
+        IMAGE_NORMALIZE_SECONDS.observe(info["seconds"])
+        IMAGE_BYTES.observe(info["bytes_in"], stage="in")
+        IMAGE_BYTES.observe(info["bytes_out"], stage="out")
+        logger.info(
+            "Normalized image %s: %s %dx%d %s, %d bytes -> JPEG %dx%d q%d, %d bytes in %.0fms",
+            filename or "<unnamed>",
+            info["format"],
+            info["width"],
+            info["height"],
+            info["mode"],
+            info["bytes_in"],
+            info["width_out"],
+            info["height_out"],
+            info["quality"],
+            info["bytes_out"],
+            info["seconds"] * 1000,
+        )
+        return normalized
     except UnidentifiedImageError:
         logger.warning("Unrecognized image format for %s; sending raw bytes", filename)
     except Exception:
@@ -267,31 +497,51 @@ def normalize_image_bytes(image_bytes: bytes, filename: str = "") -> bytes:
 def mistral_ocr_image_bytes(image_bytes: bytes) -> str:
     if not MISTRAL_API_KEY:
         raise RuntimeError("MISTRAL_API_KEY missing")
+    # mistralai is slow to import; only the ingest worker ever needs it
+    from ocr_client import get_client as get_ocr_client
 
-    client = Mistral(api_key=MISTRAL_API_KEY)
-    b64 = base64.b64encode(image_bytes).decode("utf-8")
-
-    # Use chat completions with vision for OCR
-    data_uri = f"data:image/jpeg;base64,{b64}"
-    messages = [
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": "Extract all text from this image and return it in markdown format. Include any lists, tables, or structured content you see."},
-                {"type": "image_url", "image_url": data_uri}
-            ]
-        }
-    ]
-
-    resp = client.chat.complete(
-        model="pixtral-large-latest",
-        messages=messages
-    )
-
-    if hasattr(resp, "choices") and resp.choices:
-        return resp.choices[0].message.content or ""
-
-    return ""
+    start = time.perf_counter()
+    try:
+        text = get_ocr_client(MISTRAL_API_KEY).ocr_image_bytes(image_bytes)
+    except Exception:
+        OCR_SECONDS.observe(time.perf_counter() - start, outcome="error")
+        OCR_FAILURES.inc()
+        raise
+    OCR_SECONDS.observe(time.perf_counter() - start, outcome="ok")
+    return text
+
+
+ocr_cache: Optional[OCRCache] = None
+_ocr_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> Optional[OCRCache]:
+    """The on-disk OCR cache, opened on first use (page workers race for it)"""
+    global ocr_cache
+    if ocr_cache is None and OCR_CACHE_DIR:
+        with _ocr_cache_lock:
+            if ocr_cache is None:
+                ocr_cache = OCRCache()
+    return ocr_cache
+
+
+def ocr_image_cached(image_bytes: bytes) -> str:
+    """OCR normalized image bytes, reusing a cached result for identical input"""
+    from ocr_client import OCR_MODEL, OCR_PROMPT
+
+    key = None
+    ocr_cache = get_ocr_cache()
+    if ocr_cache:
+        key = OCRCache.key_for(image_bytes, OCR_MODEL, OCR_PROMPT)
+        cached = ocr_cache.get(key)
+        CACHE_LOOKUPS.inc(cache="ocr", result="miss" if cached is None else "hit")
+        if cached is not None:
+            logger.info("OCR cache hit %s (%d chars)", key[:12], len(cached))
+            return cached
+    text = mistral_ocr_image_bytes(image_bytes)
+    if key and text.strip():
+        ocr_cache.put(key, text)
+    return text
 
 
 def decode_mime_words(s):
@@ -307,11 +557,12 @@ def decode_mime_words(s):
     return out
 
 
-def sender_allowed(from_header: str) -> bool:
-    if not ALLOWED_SENDERS:
+def sender_allowed(from_header: str, loc: Optional[Location] = None) -> bool:
+    allowed = (loc.allowed_senders if loc is not None else None) or ALLOWED_SENDERS
+    if not allowed:
         return True
     from_header = (from_header or "").lower()
-    return any(a in from_header for a in ALLOWED_SENDERS)
+    return any(a in from_header for a in allowed)
 
 
 def subject_matches(subject: str) -> bool:
@@ -325,113 +576,185 @@ def subject_matches(subject: str) -> bool:
     return True
 
 
-def extract_first_image_attachment(msg: Message) -> Optional[Tuple[bytes, str, str]]:
-    part_count = 0
-    for idx, part in enumerate(msg.walk()):
-        part_count += 1
-        if part.is_multipart():
-            logger.info("Part %d is multipart container, skipping", idx)
+def _log_attachment(filename: str, part: dict, size: int):
+    logger.info(
+        "Using %s part %s (section=%s, %d bytes, disposition=%s)",
+        part["content_type"],
+        filename,
+        part["section"],
+        size,
+        part["disposition"] or "<none>",
+    )
+
+
+def extract_plan_attachments(raw: bytes) -> list[Tuple[bytes, str, str]]:
+    """Plan images and PDFs of a raw message in page order; only those parts are decoded"""
+    parts = scan_parts(raw)
+    attachments = []
+    for part in plan_parts(parts, PLAN_MAX_ATTACHMENTS):
+        payload = decode_part(raw, part)
+        if not payload:
+            logger.warning("Section %s missing payload", part["section"])
             continue
-        ctype = part.get_content_type() or ""
-        disposition = part.get("Content-Disposition") or ""
-        filename = part.get_filename() or ""
-        logger.info(
-            "Email part %d -> type=%s disposition=%s filename=%s",
-            idx,
-            ctype,
-            disposition or "<none>",
-            filename or "<none>",
-        )
-        if not ctype.startswith("image/"):
+        filename = decode_mime_words(part["filename"]) or f"inline-image-{part['section']}"
+        _log_attachment(filename, part, len(payload))
+        attachments.append((payload, filename, part["content_type"]))
+    if not attachments:
+        logger.warning("No image attachment candidates found in %d parts examined", len(parts))
+    return attachments
+
+
+def _uid_fetch_result(data, uid: str) -> dict:
+    """Items of a one-message UID FETCH.
+
+    Responses are keyed by sequence number and the server may slip in
+    unsolicited FETCH (FLAGS ...) updates for other messages, so pick the
+    entry by its UID, as the batched header fetch does.
+    """
+    for fields in parse_fetch_response(data).values():
+        if (fields.get("UID") or b"").decode() == uid:
+            return fields
+    return {}
+
+
+def imap_fetch_plan_attachments(M, uid: str, structure) -> list[Tuple[bytes, str, str]]:
+    """Download only the image and PDF MIME sections that make up a plan"""
+    parts = parse_bodystructure(structure)
+    candidates = plan_parts(parts, PLAN_MAX_ATTACHMENTS) if parts else []
+    if not candidates:
+        # Unparseable structure, or no image/PDF we can see in it (some
+        # servers describe forwarded messages poorly); pull the whole message
+        logger.warning("No plan parts in BODYSTRUCTURE for UID %s, fetching full message", uid)
+        with IMAP_SECONDS.time(op="fetch_message"):
+            typ, msg_data = M.uid("FETCH", uid, "(BODY.PEEK[])")
+        raw = fetch_item(_uid_fetch_result(msg_data, uid), "BODY[") if typ == "OK" else None
+        if not raw:
+            logger.warning("Failed to fetch UID %s (%s)", uid, typ)
+            return []
+        return extract_plan_attachments(raw)
+
+    attachments = []
+    for part in candidates:
+        section = part["section"]
+        with IMAP_SECONDS.time(op="fetch_part"):
+            typ, part_data = M.uid("FETCH", uid, f"(BODY.PEEK[{section}])")
+        if typ != "OK" or not part_data:
+            logger.warning("Failed to fetch section %s of UID %s (%s)", section, uid, typ)
             continue
-        payload = part.get_payload(decode=True)
-        if not isinstance(payload, (bytes, bytearray)):
-            logger.warning("Image part %d missing payload", idx)
+        raw = fetch_item(_uid_fetch_result(part_data, uid), "BODY[")
+        payload = decode_section(raw or b"", part["encoding"])
+        if not payload:
+            logger.warning("Section %s of UID %s missing payload", section, uid)
             continue
-        filename = filename or f"inline-image-{idx}"
-        logger.info(
-            "Using image part %s (ctype=%s, %s bytes, disposition=%s)",
-            filename,
-            ctype,
-            len(payload),
-            disposition or "<none>",
-        )
-        return bytes(payload), filename, ctype
-    logger.warning("No image attachment candidates found in %d parts examined", part_count)
-    return None
+        filename = part["filename"] or f"inline-image-{section}"
+        _log_attachment(filename, part, len(payload))
+        attachments.append((payload, filename, part["content_type"]))
 
+    if not attachments:
+        logger.warning("No image parts among %d MIME sections of UID %s", len(parts), uid)
+    return attachments
 
-def imap_fetch_latest_matching_attachment():
-    if not (GMAIL_USER and GMAIL_APP_PASSWORD):
-        logger.warning("Gmail credentials are missing, skipping IMAP fetch")
-        return None, None
-
-    logger.info("Connecting to Gmail IMAP for %s", GMAIL_USER)
-    M = imaplib.IMAP4_SSL("imap.gmail.com", 993)
-    M.login(GMAIL_USER, GMAIL_APP_PASSWORD)
-    M.select("INBOX")
-
-    # First try UNSEEN messages
-    typ, data = M.search(None, "(UNSEEN)")
-    if typ != "OK":
-        logger.warning("IMAP search failed (%s)", typ)
-        M.logout()
-        return None, None
-
-    ids = data[0].split()
-    logger.info("Found %d unseen messages", len(ids))
-
-    # If no unseen messages, check last 10 messages anyway (in case they were marked read)
-    if not ids:
-        logger.info("No unseen messages, checking last 10 messages regardless of read status...")
-        typ, data = M.search(None, "ALL")
+
+def imap_search_new_uids(session: IMAPSession) -> list[int]:
+    """UIDs that arrived since the last processed one, oldest first.
+
+    Uses UID SEARCH UID <last+1>:* so the cost tracks new mail, not mailbox
+    size. If the mailbox UIDVALIDITY changed, stored UIDs are meaningless and
+    we start over as on a first run.
+    """
+    M = session.conn
+    last_uid = mail_state.get("last_uid")
+    try:
+        last_uid = int(last_uid) if last_uid is not None else None
+    except (TypeError, ValueError):
+        last_uid = None
+    if mail_state.get("uidvalidity") != session.uidvalidity:
+        if last_uid is not None:
+            logger.warning(
+                "UIDVALIDITY changed (%s -> %s), rescanning recent messages",
+                mail_state.get("uidvalidity"),
+                session.uidvalidity,
+            )
+        last_uid = None
+        mail_state["uidvalidity"] = session.uidvalidity
+        mail_state["last_uid"] = None
+
+    if last_uid is not None:
+        with IMAP_SECONDS.time(op="search"):
+            typ, data = M.uid("SEARCH", None, f"UID {last_uid + 1}:*")
+        if typ != "OK":
+            logger.warning("IMAP UID search failed (%s)", typ)
+            return []
+        # "n:*" always matches the newest message, even when its UID < n
+        uids = sorted(int(u) for u in data[0].split() if int(u) > last_uid)
+        logger.info("Found %d new messages since UID %s", len(uids), last_uid)
+        return uids
+
+    # First run: unseen mail, or failing that the last 10 messages
+    typ, data = M.uid("SEARCH", None, "UNSEEN")
+    uids = sorted(int(u) for u in data[0].split()) if typ == "OK" and data[0] else []
+    logger.info("First run, found %d unseen messages", len(uids))
+    if not uids:
+        start = max(1, session.exists - 9)
+        typ, data = M.uid("SEARCH", None, f"{start}:*")
         if typ == "OK" and data[0]:
-            all_ids = data[0].split()
-            # Check if we've already processed the last message
-            if all_ids and mail_state.get("last_uid"):
-                last_uid = mail_state["last_uid"]
-                # Only check messages after the last processed one
-                ids = [mid for mid in all_ids if int(mid) > int(last_uid)]
-                logger.info("Found %d new messages since last check (UID %s)", len(ids), last_uid)
-            else:
-                # First run, just check last 10
-                ids = all_ids[-10:]
-                logger.info("First run, checking last %d messages", len(ids))
-
-    if not ids:
-        M.logout()
-        return None, None
-
-    ids = ids[-10:][::-1]
-
-    for msg_id in ids:
-        msg_ref = (
-            msg_id.decode() if isinstance(msg_id, (bytes, bytearray)) else str(msg_id)
-        )
-        logger.info("Inspecting message %s", msg_ref)
-        typ, msg_data = M.fetch(msg_ref, "(RFC822 UID)")
-        if typ != "OK" or not msg_data:
-            logger.warning("Failed to fetch %s (%s)", msg_ref, typ)
-            continue
+            uids = sorted(int(u) for u in data[0].split())
+        logger.info("First run, checking last %d messages", len(uids))
+    return uids[-10:]
 
-        entry = msg_data[0]
-        if not entry or len(entry) < 2:
-            continue
-        raw_bytes = entry[1]
-        if not isinstance(raw_bytes, (bytes, bytearray)):
+
+def imap_fetch_matching_attachments(session: IMAPSession) -> list:
+    """Raw image bytes and metadata for every new matching message, oldest first"""
+    M = session.conn
+    uids = imap_search_new_uids(session)
+    if not uids:
+        return []
+
+    refs = [str(u) for u in uids]
+    fetched = {}
+    # One round trip per batch for headers and structure of every candidate;
+    # the message bodies stay on the server until we know which part we want
+    for i in range(0, len(refs), IMAP_FETCH_BATCH):
+        batch = refs[i : i + IMAP_FETCH_BATCH]
+        with IMAP_SECONDS.time(op="fetch_headers"):
+            typ, fetch_data = M.uid(
+                "FETCH",
+                ",".join(batch),
+                "(UID BODY.PEEK[HEADER.FIELDS (FROM SUBJECT TO DELIVERED-TO)] BODYSTRUCTURE)",
+            )
+        if typ != "OK" or not fetch_data:
+            logger.warning("Failed to fetch headers for %d messages (%s)", len(batch), typ)
+            return []
+        for fields in parse_fetch_response(fetch_data).values():
+            fetched[(fields.get("UID") or b"").decode()] = fields
+    header_parser = BytesHeaderParser()
+
+    jobs = []
+    for uid in refs:
+        fields = fetched.get(uid)
+        if not fields:
+            logger.warning("No FETCH data returned for UID %s", uid)
             continue
-        msg = message_from_bytes(raw_bytes)
+        headers = header_parser.parsebytes(fetch_item(fields, "BODY[HEADER") or b"")
 
-        from_h = decode_mime_words(msg.get("From", ""))
-        subj_h = decode_mime_words(msg.get("Subject", ""))
+        from_h = decode_mime_words(headers.get("From", ""))
+        subj_h = decode_mime_words(headers.get("Subject", ""))
         logger.info(
-            "Message from %s subject %s",
+            "Message UID %s from %s subject %s",
+            uid,
             from_h or "<unknown>",
             subj_h or "<no subject>",
         )
 
-        if not sender_allowed(from_h):
-            logger.warning("Sender NOT ALLOWED: %s (Allowed senders: %s)", from_h, ALLOWED_SENDERS)
+        recipients = ", ".join(headers.get_all("To", []) + headers.get_all("Delivered-To", []))
+        loc = route_email(locations, subj_h, recipients)
+        if not sender_allowed(from_h, loc):
+            logger.warning(
+                "Sender NOT ALLOWED for %s: %s (Allowed senders: %s)",
+                loc.name,
+                from_h,
+                loc.allowed_senders or ALLOWED_SENDERS,
+            )
             continue
         if not subject_matches(subj_h):
             logger.info(
@@ -440,111 +763,486 @@ def imap_fetch_latest_matching_attachment():
             )
             continue
 
-        logger.info("Sender and subject OK, extracting image attachment...")
-        attachment = extract_first_image_attachment(msg)
-        if not attachment:
+        logger.info("Sender and subject OK, locating image attachments...")
+        attachments = imap_fetch_plan_attachments(M, uid, fields.get("BODYSTRUCTURE"))
+        if not attachments:
             logger.warning("No image attachment found in email: %s", subj_h)
             continue
-        raw_image, filename, ctype = attachment
-        prepared_image = normalize_image_bytes(raw_image, filename)
-
-        logger.info("Found matching email %s, running OCR", msg_ref)
-        M.store(msg_ref, "+FLAGS", "\\Seen")
-
-        # Save the UID so we don't reprocess
-        mail_state["last_uid"] = msg_id
-        logger.info("Saved last processed UID: %s", msg_id)
-
-        M.logout()
-        return prepared_image, {
-            "from": from_h,
-            "subject": subj_h,
-            "filename": filename,
-            "content_type": ctype,
-        }
 
-    M.logout()
-    return None, None
+        logger.info(
+            "Found matching email UID %s for %s with %d attachments, queueing for OCR",
+            uid,
+            loc.name,
+            len(attachments),
+        )
+        M.uid("STORE", uid, "+FLAGS", "\\Seen")
+        jobs.append(
+            (
+                attachments,
+                {
+                    "uid": uid,
+                    "location": loc.name,
+                    "from": from_h,
+                    "subject": subj_h,
+                    "filename": ", ".join(name for _, name, _ in attachments),
+                    "content_type": ", ".join(ctype for _, _, ctype in attachments),
+                },
+            )
+        )
+
+    # Save the UID so we don't reprocess
+    with write_transaction(default_location):
+        mail_state["last_uid"] = uids[-1]
+        save_state()
+    logger.info("Saved last processed UID: %s", uids[-1])
+    return jobs
+
+
+def prepare_pages(attachment: Tuple[bytes, str, str], record) -> list[Tuple[bytes, str]]:
+    """OCR-ready JPEG pages for one attachment: one for a photo, one per PDF page"""
+    data, filename, ctype = attachment
+    start = time.monotonic()
+    if not is_pdf(ctype, filename):
+        img_bytes = normalize_image_bytes(data, filename)
+        record("normalize", time.monotonic() - start)
+        return [(img_bytes, filename)]
+    import image_pipeline
+
+    if not image_pipeline.PDF_SUPPORT:
+        logger.warning("Skipping PDF %s: install pypdfium2 to OCR PDF bake plans", filename)
+        return []
+    try:
+        pages = image_pipeline.prepare_pdf_pages(data)
+    except Exception:
+        logger.exception("Failed to render PDF %s", filename)
+        return []
+    record("render_pdf", time.monotonic() - start)
+    logger.info("Rendered %d pages of %s in %.0fms", len(pages), filename, (time.monotonic() - start) * 1000)
+    return [(page, f"{filename}#{info['page']}") for page, info in pages]
+
+
+def ocr_page(page: Tuple[bytes, str], record) -> Optional[str]:
+    img_bytes, label = page
+    start = time.monotonic()
+    try:
+        text = ocr_image_cached(img_bytes)
+    except Exception:
+        logger.exception("Mistral OCR failed for %s", label)
+        return None
+    finally:
+        record("ocr", time.monotonic() - start)
+    if not text.strip():
+        logger.warning("Mistral OCR returned empty text for %s", label)
+    return text
+
+
+def run_ingest_job(job, record) -> Optional[dict]:
+    """Worker side of the ingest queue: normalize, OCR and match one message's pages.
+
+    Pages are prepared and OCR'd concurrently on page_pool, so a three-photo
+    plan takes about as long as its slowest page.
+    """
+    attachments, meta = job
+    subj = meta.get("subject", "<no subject>")
+
+    pages = [
+        page
+        for prepared in page_pool.map(lambda a: prepare_pages(a, record), attachments)
+        for page in prepared
+    ]
+    if not pages:
+        logger.warning("No usable pages in email %s", subj)
+        return None
+
+    logger.info(
+        "Running OCR for email from %s subject %s on %d pages (%s bytes)",
+        meta.get("from", "<unknown>"),
+        subj,
+        len(pages),
+        sum(len(p) for p, _ in pages),
+    )
+    start = time.monotonic()
+    texts = list(page_pool.map(lambda p: ocr_page(p, record), pages))
+    record("ocr_pages", time.monotonic() - start)
+    if all(text is None for text in texts):
+        raise RuntimeError(f"OCR failed for every page of {subj}")
+
+    start = time.monotonic()
+    # Candidates keep page order; duplicates across pages collapse in split_candidate_lines
+    candidates = split_candidate_lines("\n".join(text for text in texts if text))
+    logger.info("OCR candidates extracted (%d entries)", len(candidates))
+    plan = fuzzy_match_to_menu(candidates, load_menu_index(locations.get(meta.get("location"))))
+    record("match", time.monotonic() - start)
+    logger.info("Plan resolved (%d items): %s", len(plan), plan[:5])
+    return {"plan": plan, "meta": meta}
+
+
+def apply_ingest_result(result: dict):
+    """Applied in message order, so the newest bake plan always wins"""
+    plan = result["plan"][:200]
+    loc = locations.get(result["meta"].get("location")) or default_location
+    timeline = compile_bake_timeline(plan, loc)
+    with write_transaction(loc):
+        loc.state["date"] = today_key()
+        loc.state["bake_items"] = plan
+        loc.state["bake_timeline"] = timeline
+        loc.state["bake_source"] = ""
+        loc.state["updated_at"] = iso()
+        publish_change(loc, "bake")
+        save_state(loc)
+    logger.info(
+        "✓ State for %s updated with %d bake items from UID %s at %s",
+        loc.name,
+        len(plan),
+        result["meta"].get("uid"),
+        loc.state["updated_at"],
+    )
+
+
+def _page_executor():
+    """Pool for the CPU-bound page work (PIL decode/resize, PDF rendering).
+
+    Under gevent, threading.Thread is a greenlet and a PIL resize would
+    freeze every open stream on the worker, so use gevent's pool of real OS
+    threads instead; PIL releases the GIL while it works. The ingest queue
+    itself stays on greenlets: it only waits on these futures and does the
+    short state write, which can still block the hub for as long as SQLite
+    waits on a busy database.
+    """
+    workers = max(1, OCR_PAGE_WORKERS)
+    try:
+        from gevent import monkey
+    except ImportError:
+        monkey = None
+    if monkey is not None and monkey.is_module_patched("threading"):
+        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+
+        return NativeThreadPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-page")
+
+
+def _start_ingest():
+    """Thread pools for the ingest pipeline, created once this worker holds the lease"""
+    global page_pool, ingest_queue
+    if ingest_queue is None:
+        page_pool = _page_executor()
+        ingest_queue = OrderedJobQueue(
+            run_ingest_job,
+            apply_ingest_result,
+            workers=INGEST_WORKERS,
+            maxsize=INGEST_QUEUE_MAX,
+        )
 
 
 def email_loop():
-    time.sleep(3)
-    while True:
+    if _stop.wait(3):
+        return
+    if not (GMAIL_USER and GMAIL_APP_PASSWORD):
+        logger.warning("Gmail credentials are missing, email ingest disabled")
+        return
+
+    store = default_location.store
+    idle_seconds = IMAP_IDLE_SECONDS
+    if store.multi_process:
+        # Wake up often enough to renew the ingest lease
+        idle_seconds = min(idle_seconds, max(10, INGEST_LEASE_SECONDS // 3))
+    session = IMAPSession(
+        IMAP_HOST,
+        IMAP_PORT,
+        GMAIL_USER,
+        GMAIL_APP_PASSWORD,
+        use_ssl=IMAP_SSL,
+        idle_seconds=idle_seconds,
+        poll_seconds=max(10, EMAIL_POLL_SECONDS),
+        stop=_stop,
+    )
+    leader = False
+    while not _stop.is_set():
         try:
-            ensure_daily_reset()
-
-            img_bytes, meta = imap_fetch_latest_matching_attachment()
-            if img_bytes:
-                sender = (meta or {}).get("from", "<unknown>")
-                subj = (meta or {}).get("subject", "<no subject>")
-                filename = (meta or {}).get("filename", "<no filename>")
-                ctype = (meta or {}).get("content_type", "<unknown>")
+            # Only one worker process talks to IMAP at a time
+            if not store.acquire_lease("email_ingest", WORKER_ID, INGEST_LEASE_SECONDS):
+                if leader:
+                    logger.warning("Lost email ingest lease, closing IMAP session")
+                    session.close()
+                    leader = False
+                _stop.wait(max(5, INGEST_LEASE_SECONDS // 3))
+                continue
+            if not leader:
+                logger.info("Holding email ingest lease as %s", WORKER_ID)
+                leader = True
+                _start_ingest()
+
+            session.ensure()
+            jobs = imap_fetch_matching_attachments(session)
+            for job in jobs:
+                ingest_queue.submit(job)
+            if jobs:
                 logger.info(
-                    "Running OCR for email from %s subject %s file %s (%s bytes, %s)",
-                    sender,
-                    subj,
-                    filename,
-                    len(img_bytes),
-                    ctype,
+                    "Queued %d bake plan images (queue depth %d)",
+                    len(jobs),
+                    ingest_queue.metrics()["depth"],
                 )
-                try:
-                    ocr_text = mistral_ocr_image_bytes(img_bytes)
-                except Exception:
-                    logger.exception("Mistral OCR failed for %s", subj)
-                    time.sleep(max(10, EMAIL_POLL_SECONDS))
-                    continue
-                if not ocr_text.strip():
-                    logger.warning("Mistral OCR returned empty text for %s", filename)
-                candidates = split_candidate_lines(ocr_text)
-                logger.info("OCR candidates extracted (%d entries)", len(candidates))
-                menu = load_menu_items()
-                plan = fuzzy_match_to_menu(candidates, menu)
-                logger.info("Plan resolved (%d items): %s", len(plan), plan[:5])
-
-                with lock:
-                    state["date"] = today_key()
-                    state["bake_items"] = plan[:200]
-                    state["bake_source"] = ""
-                    state["updated_at"] = iso()
-                    save_state()
-                logger.info("✓ State updated with %d bake items at %s", len(plan), state["updated_at"])
+                # More mail may have arrived meanwhile; look again right away
+                continue
 
+            session.wait_for_mail()
+        except (imaplib.IMAP4.error, OSError) as exc:
+            logger.warning("IMAP session failed: %s", exc)
+            session.reset_after_error()
         except Exception:
             logger.exception("Background email loop crashed")
+            _stop.wait(max(10, EMAIL_POLL_SECONDS))
+    session.close()
 
-        time.sleep(max(10, EMAIL_POLL_SECONDS))
 
+def rollover_loop():
+    """Fire each location's daily reset as soon as its deadline passes"""
+    while not _stop.is_set():
+        try:
+            for loc in list(locations.values()):
+                ensure_daily_reset(loc)
+            deadline = min(loc.reset_deadline for loc in locations.values())
+        except Exception:
+            logger.exception("Rollover loop crashed")
+            deadline = time.time() + 60
+        # Wake up at least every few minutes in case the wall clock jumps
+        _stop.wait(min(300, max(1, deadline - time.time())))
+
+
+def bake_index_loop():
+    """Push bake index rollovers to stream listeners as the shift progresses"""
+    while not _stop.is_set():
+        # Clear before reading the timelines, so a plan that lands while we
+        # look at them still wakes the wait below
+        bake_timeline_changed.clear()
+        wake_at = time.time() + 300
+        for loc in list(locations.values()):
+            try:
+                with loc.lock:
+                    window = bake_window(loc)
+                    idx = window["current_index"]
+                    if loc.last_bake_index["value"] is None:
+                        loc.last_bake_index["value"] = idx
+                    elif idx != loc.last_bake_index["value"]:
+                        logger.info("Bake index for %s rolled over to %d", loc.name, idx)
+                        publish_change(loc, "index")
+                if window["next_change"]:
+                    wake_at = min(wake_at, window["next_change"])
+            except Exception:
+                logger.exception("Bake index loop crashed for %s", loc.name)
+        # Sleep until the next slot starts, or until a new plan arrives
+        bake_timeline_changed.wait(max(1, wake_at - time.time()))
+
+
+page_pool: Optional[ThreadPoolExecutor] = None
+ingest_queue: Optional[OrderedJobQueue] = None
+_stop = threading.Event()
+_workers_lock = threading.Lock()
+_workers_started = False
+_email_thread: Optional[threading.Thread] = None
+
+
+def start_workers():
+    """Open the state stores and start the background loops in this process.
+
+    Call it after fork (gunicorn.conf.py does, from post_worker_init) so no
+    SQLite connection, file handle or thread is shared between workers. It
+    is idempotent; the first request starts the workers if nobody else did.
+    """
+    global WORKER_ID, default_location, _workers_started, _email_thread
+    with _workers_lock:
+        if _workers_started:
+            return
+        start = time.perf_counter()
+        WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+        _stop.clear()
+        locations.clear()
+        for name, config in load_location_config(LOCATIONS, LOCATIONS_FILE).items():
+            locations[name] = _create_location(name, config)
+        default_location = locations[DEFAULT_LOCATION]
+        load_roast_catalog()
+        load_state()
+        for loc in locations.values():
+            loc.history.open()
+            loc.store.start(
+                loc.state,
+                mail_state if loc is default_location else {},
+                on_change=functools.partial(on_store_change, loc),
+            )
+        STARTUP_SECONDS.observe(time.perf_counter() - start, phase="state")
 
-threading.Thread(target=email_loop, daemon=True).start()
+        threading.Thread(target=rollover_loop, name="rollover", daemon=True).start()
+        threading.Thread(target=bake_index_loop, name="bake-index", daemon=True).start()
+        if INGEST_ENABLED:
+            _email_thread = threading.Thread(target=email_loop, name="email-ingest", daemon=True)
+            _email_thread.start()
+        else:
+            logger.info("INGEST_ENABLED is off, worker %s serves the web only", WORKER_ID)
+        atexit.register(stop_workers)
+        _workers_started = True
+
+    elapsed_ms = (time.perf_counter() - _IMPORT_STARTED) * 1000
+    STARTUP_SECONDS.observe(elapsed_ms / 1000, phase="ready")
+    if elapsed_ms > STARTUP_BUDGET_MS:
+        logger.warning("Worker %s ready in %.0fms, over the %.0fms startup budget", WORKER_ID, elapsed_ms, STARTUP_BUDGET_MS)
+    else:
+        logger.info("Worker %s ready in %.0fms", WORKER_ID, elapsed_ms)
+
+
+def stop_workers():
+    """Stop the background loops, release the ingest lease and close the stores"""
+    global page_pool, ingest_queue, _workers_started, _email_thread
+    with _workers_lock:
+        if not _workers_started:
+            return
+        _stop.set()
+        bake_timeline_changed.set()
+        deadline = time.monotonic() + INGEST_DRAIN_SECONDS
+        # The email loop may have fetched jobs (and saved last_uid) that it
+        # has yet to submit; let it finish before the queue stops taking them
+        if _email_thread is not None and _email_thread is not threading.current_thread():
+            _email_thread.join(max(0.0, deadline - time.monotonic()))
+            if _email_thread.is_alive():
+                logger.warning("Email loop still busy after %.0fs, stopping anyway", INGEST_DRAIN_SECONDS)
+        _email_thread = None
+        # Then drain the queue: its jobs still need page_pool
+        if ingest_queue is not None and not ingest_queue.close(timeout=max(0.0, deadline - time.monotonic())):
+            logger.warning("Ingest jobs still running after %.0fs, stopping anyway", INGEST_DRAIN_SECONDS)
+        ingest_queue = None
+        if page_pool is not None:
+            page_pool.shutdown(wait=False, cancel_futures=True)
+        page_pool = None
+        try:
+            default_location.store.release_lease("email_ingest", WORKER_ID)
+        except Exception:
+            logger.exception("Could not release the email ingest lease")
+        for loc in locations.values():
+            loc.store.close()
+            loc.history.close()
+        _workers_started = False
+
+
+@bp.before_app_request
+def _start_timer():
+    if not _workers_started:
+        start_workers()
+    g.request_start = time.perf_counter()
+
+
+@bp.after_app_request
+def _record_latency(resp):
+    start = g.pop("request_start", None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - start, route=route, method=request.method, status=resp.status_code
+        )
+    return resp
+
+
+def get_location(name: str) -> Location:
+    loc = locations.get((name or "").lower())
+    if loc is None:
+        abort(404)
+    return loc
+
+
+@bp.app_errorhandler(404)
+def not_found(_e):
+    if request.path.startswith("/api/"):
+        return jsonify({"ok": False, "error": "not found"}), 404
+    return "not found", 404
+
+
+@bp.route("/")
+@bp.route("/sign/<location>")
+def index(location: str = DEFAULT_LOCATION):
+    loc = get_location(location)
+    api_base = "/api" if loc is default_location else f"/api/{loc.name}"
+    return render_template("index.html", state_poll_seconds=STATE_POLL_SECONDS, api_base=api_base)
+
+
+@bp.route("/api/state")
+@bp.route("/api/<location>/state")
+def api_state(location: str = DEFAULT_LOCATION):
+    loc = get_location(location)
+    ensure_daily_reset(loc)
+    cache = loc.body_cache
+    STATE_POLLS.inc(location=loc.name)
+    with read_lock(loc):
+        window = bake_window(loc)
+        key = (loc.state["version"], window["current_index"])
+        CACHE_LOOKUPS.inc(cache="state_body", result="hit" if cache["key"] == key else "miss")
+        if cache["key"] != key:
+            logger.debug("API /state rebuilding body for %s version %s index %s", loc.name, *key)
+            cache["body"] = json.dumps(
+                state_payload(loc, window), separators=(",", ":")
+            ).encode("utf-8")
+            cache["etag"] = "v%d.%d" % key
+            cache["key"] = key
+        body = cache["body"]
+        etag = cache["etag"]
+
+    if request.if_none_match.contains(etag):
+        STATE_NOT_MODIFIED.inc(location=loc.name)
+        resp = current_app.response_class(status=304)
+    else:
+        resp = current_app.response_class(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
 
 
-@app.route("/")
-def index():
-    return render_template("index.html", state_poll_seconds=STATE_POLL_SECONDS)
+def _snapshot_event(loc: Location) -> Tuple[int, str]:
+    """Full state as a stream event; caller must hold loc.lock"""
+    seq = loc.broadcaster.last_seq
+    payload = state_payload(loc, bake_window(loc))
+    return seq, loc.broadcaster.format(seq, "state", json.dumps(payload, separators=(",", ":")))
 
 
-@app.route("/api/state")
-def api_state():
-    ensure_daily_reset()
-    with lock:
-        logger.info("API /state called - bake_items count: %d, updated_at: %s",
-                   len(state.get("bake_items", [])), state.get("updated_at"))
-        bake_window = compute_bake_window(state["bake_items"])
-        return jsonify(
-            {
-                "date": state["date"],
-                "roast_current": state["roast_current"],
-                "roasts_today": state["roasts_today"],
-                "bake_items": state["bake_items"],
-                "bake_current_index": bake_window["current_index"],
-                "updated_at": state["updated_at"],
-            }
-        )
+def stream_events(loc: Location, cursor: int, snapshot: Optional[str]):
+    yield f"retry: {SSE_RETRY_MS}\n\n"
+    if snapshot:
+        yield snapshot
+    while True:
+        events = loc.broadcaster.wait(cursor, SSE_HEARTBEAT_SECONDS)
+        if not events:
+            yield ": ping\n\n"
+            continue
+        if events[0][0] > cursor + 1:
+            # Listener fell behind the replay backlog; resync with a snapshot
+            with read_lock(loc):
+                cursor, snapshot = _snapshot_event(loc)
+            yield snapshot
+            continue
+        for seq, event, body in events:
+            yield loc.broadcaster.format(seq, event, body)
+            cursor = seq
+
+
+@bp.route("/api/stream")
+@bp.route("/api/<location>/stream")
+def api_stream(location: str = DEFAULT_LOCATION):
+    loc = get_location(location)
+    ensure_daily_reset(loc)
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    with read_lock(loc):
+        cursor = loc.broadcaster.parse_last_id(last_event_id)
+        snapshot = None
+        if cursor is None:
+            cursor, snapshot = _snapshot_event(loc)
+    logger.debug("API /stream opened for %s (last_event_id=%s)", loc.name, last_event_id or "<none>")
+    return current_app.response_class(
+        stream_events(loc, cursor, snapshot),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
-@app.route("/api/roast", methods=["GET", "POST"])
-def api_roast():
-    ensure_daily_reset()
+@bp.route("/api/roast", methods=["GET", "POST"])
+@bp.route("/api/<location>/roast", methods=["GET", "POST"])
+def api_roast(location: str = DEFAULT_LOCATION):
+    loc = get_location(location)
     item = ""
     if request.method == "GET":
         item = request.args.get("item", "").strip()
@@ -554,60 +1252,174 @@ def api_roast():
 
     if not item:
         return jsonify({"ok": False, "error": "missing item"}), 400
+    if ROAST_CATALOG_ONLY and roast_names:
+        if item.lower() not in roast_names:
+            return jsonify({"ok": False, "error": "unknown coffee"}), 400
+        item = roast_names[item.lower()]
 
-    with lock:
-        state["date"] = today_key()
-        state["roast_current"] = item
-        if not state["roasts_today"] or state["roasts_today"][-1] != item:
-            state["roasts_today"].append(item)
-            state["roasts_today"] = state["roasts_today"][-ROASTS_MAX:]
-        state["updated_at"] = iso()
-        save_state()
-
+    record_roast(loc, item)
     return jsonify({"ok": True})
 
 
-@app.route("/api/bake", methods=["POST"])
-def api_bake():
-    ensure_daily_reset()
+@bp.route("/r/<code>")
+@bp.route("/R/<code>")
+@bp.route("/r/<location>/<code>")
+@bp.route("/R/<location>/<code>")
+def roast_short_code(code: str, location: str = DEFAULT_LOCATION):
+    """What the roast QR codes encode: /R/<code> from coffees.json"""
+    loc = get_location(location)
+    item = roast_codes.get(code.upper())
+    if item is None:
+        return jsonify({"ok": False, "error": "unknown code"}), 404
+    record_roast(loc, item)
+    return jsonify({"ok": True, "item": item})
+
+
+def record_roast(loc: Location, item: str):
+    ensure_daily_reset(loc)
+    with write_transaction(loc):
+        s = loc.state
+        s["date"] = today_key()
+        s["roast_current"] = item
+        if not s["roasts_today"] or s["roasts_today"][-1] != item:
+            s["roasts_today"].append(item)
+            s["roasts_today"] = s["roasts_today"][-ROASTS_MAX:]
+        s["updated_at"] = iso()
+        publish_change(loc, "roast")
+        save_state(loc)
+
+    try:
+        loc.history.append(item)
+    except (OSError, ValueError):
+        logger.exception("Could not record roast of %s in the history log", item)
+
+
+def _parse_day(value: str, default):
+    if not value:
+        return default
+    try:
+        return datetime.strptime(value.strip(), "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+@bp.route("/api/roasts/history")
+@bp.route("/api/<location>/roasts/history")
+def api_roast_history(location: str = DEFAULT_LOCATION):
+    """Roast counts (and optionally events) for a day range.
+
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD (each defaults to today), ?coffee=<name> narrows
+    to one coffee, ?events=1 lists individual roasts (at most ?limit=).
+    """
+    loc = get_location(location)
+    today = now_local().date()
+    start = _parse_day(request.args.get("from", ""), today)
+    end = _parse_day(request.args.get("to", ""), today)
+    if start is None or end is None:
+        return jsonify({"ok": False, "error": "dates must be YYYY-MM-DD"}), 400
+    if end < start:
+        return jsonify({"ok": False, "error": "to is before from"}), 400
+    coffee = request.args.get("coffee", "").strip()
+
+    result = loc.history.counts(start, end, coffee)
+    payload = {"ok": True, "from": start.isoformat(), "to": end.isoformat(), **result}
+    if coffee:
+        payload["coffee"] = coffee
+    if request.args.get("events", "").strip().lower() in ("1", "true", "yes"):
+        try:
+            limit = int(request.args.get("limit", "1000"))
+        except ValueError:
+            return jsonify({"ok": False, "error": "limit must be a number"}), 400
+        limit = max(1, min(limit, ROAST_HISTORY_MAX_EVENTS))
+        payload["events"] = loc.history.events(start, end, coffee, limit)
+    return jsonify(payload)
+
+
+@bp.route("/api/bake", methods=["POST"])
+@bp.route("/api/<location>/bake", methods=["POST"])
+def api_bake(location: str = DEFAULT_LOCATION):
+    loc = get_location(location)
+    ensure_daily_reset(loc)
     data = request.get_json(silent=True) or {}
     items = data.get("items", [])
 
     if not isinstance(items, list):
         return jsonify({"ok": False, "error": "items must be a list"}), 400
 
-    # Clean and validate items
-    clean_items = [str(x).strip() for x in items if str(x).strip()]
+    # Clean and validate items; each is a name or {"name", "minutes", "weight", "at"}
+    specs = [x if isinstance(x, dict) else {"name": x} for x in items]
+    specs = [{**x, "name": str(x.get("name", "")).strip()} for x in specs]
+    specs = [x for x in specs if x["name"]]
+    clean_items = [x["name"] for x in specs]
+    for spec in specs:
+        error = slot_error(spec)
+        if error:
+            return jsonify({"ok": False, "error": f"{spec['name']}: {error}"}), 400
 
     if not clean_items:
         return jsonify({"ok": False, "error": "no valid items provided"}), 400
 
-    with lock:
-        state["date"] = today_key()
-        state["bake_items"] = clean_items[:200]  # Limit to 200 items
-        state["bake_source"] = data.get("source", "API")
-        state["updated_at"] = iso()
-        save_state()
+    timeline = compile_bake_timeline(specs[:200], loc)
+    with write_transaction(loc):
+        s = loc.state
+        s["date"] = today_key()
+        s["bake_items"] = clean_items[:200]  # Limit to 200 items
+        s["bake_timeline"] = timeline
+        s["bake_source"] = data.get("source", "API")
+        s["updated_at"] = iso()
+        publish_change(loc, "bake")
+        save_state(loc)
 
     return jsonify({"ok": True, "count": len(clean_items)})
 
 
-@app.route("/health")
+@bp.route("/health")
 def health():
     return "ok", 200
 
 
-@app.route("/api/debug")
+@bp.route("/metrics")
+def metrics():
+    return current_app.response_class(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@bp.route("/api/debug")
 def api_debug():
-    with lock:
+    loc = default_location
+    with loc.lock:
         debug_info = {
-            "raw_state": dict(state),
-            "state_id": id(state),
-            "lock_id": id(lock),
+            "raw_state": dict(loc.state),
+            "state_id": id(loc.state),
+            "lock_id": id(loc.lock),
+            "store": loc.store.describe(),
+            "locations": {
+                name: {
+                    "version": loc.state.get("version"),
+                    "store": loc.store.describe(),
+                    "history": loc.history.describe(),
+                }
+                for name, loc in locations.items()
+            },
+            "worker_id": WORKER_ID,
+            "ocr_cache": ocr_cache.stats() if ocr_cache else None,
+            "ingest": ingest_queue.metrics() if ingest_queue else None,
         }
     logger.info("DEBUG: State dump: %s", debug_info)
     return jsonify(debug_info)
 
 
+def create_app() -> Flask:
+    """The sign's Flask app. Cheap: no I/O and no threads until start_workers()"""
+    start = time.perf_counter()
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(bp)
+    STARTUP_SECONDS.observe(time.perf_counter() - start, phase="app")
+    return flask_app
+
+
+app = create_app()
+
+
 if __name__ == "__main__":
+    start_workers()
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")))
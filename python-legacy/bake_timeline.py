@@ -0,0 +1,117 @@
+"""
+Bake plan timelines.
+
+A plan is compiled once, when it is set, into the start time (epoch seconds)
+of every item across the shift. Items with a fixed duration ("minutes") get
+exactly that; the rest share the remaining time in proportion to their
+"weight" (default 1, so a plain list splits the shift evenly). An item
+pinned to a clock time ("at": "HH:MM") starts a new segment there; fixed
+durations that would run past the next pin are cut short at it, so the
+start times always stay in order.
+
+Finding the current item is then a bisect over the start times, and the
+next start time says exactly when the sign needs to change.
+"""
+import bisect
+import math
+from datetime import date, datetime, time as dtime, tzinfo
+from typing import Optional
+
+# Bounds that keep the arithmetic finite; no real item bakes for over a day
+MAX_MINUTES = 24 * 60
+MAX_WEIGHT = 1e6
+
+
+def _clock(value) -> Optional[dtime]:
+    try:
+        hour, minute = str(value).strip().split(":")
+        return dtime(int(hour), int(minute))
+    except (TypeError, ValueError):
+        return None
+
+
+def _minutes(value) -> Optional[float]:
+    try:
+        minutes = float(value)
+    except (TypeError, ValueError):
+        return None
+    return min(minutes, MAX_MINUTES) if math.isfinite(minutes) and minutes >= 0 else None
+
+
+def _weight(value) -> float:
+    try:
+        weight = float(value)
+    except (TypeError, ValueError):
+        return 1.0
+    return min(max(0.0, weight), MAX_WEIGHT) if math.isfinite(weight) else 1.0
+
+
+def slot_error(slot: dict) -> Optional[str]:
+    """Why a plan item's minutes/weight can't be used, or None.
+
+    Unparseable values just fall back to the defaults, but inf and nan are
+    almost certainly a client bug and would break the arithmetic, so callers
+    should reject them.
+    """
+    for key in ("minutes", "weight"):
+        try:
+            value = float(slot.get(key))
+        except (TypeError, ValueError):
+            continue
+        if not math.isfinite(value):
+            return f"{key} must be a finite number"
+    return None
+
+
+def compile_timeline(slots: list[dict], day: date, start_hour: int, end_hour: int, tz: tzinfo) -> dict:
+    """Timeline for one plan; slots holds {"minutes"?, "weight"?, "at"?} per item, in plan order"""
+    start = int(datetime.combine(day, dtime(start_hour), tzinfo=tz).timestamp())
+    end = int(datetime.combine(day, dtime(end_hour), tzinfo=tz).timestamp())
+
+    # Pinned items split the shift into segments; pins may not go backwards
+    segments = [(start, [])]
+    for i, slot in enumerate(slots):
+        at = _clock(slot.get("at"))
+        if at is not None and i > 0:
+            pinned = int(datetime.combine(day, at, tzinfo=tz).timestamp())
+            segments.append((max(pinned, segments[-1][0]), []))
+        elif at is not None:
+            segments[0] = (int(datetime.combine(day, at, tzinfo=tz).timestamp()), [])
+        segments[-1][1].append(i)
+
+    starts = [0] * len(slots)
+    t = float(start)
+    for k, (seg_start, members) in enumerate(segments):
+        seg_end = segments[k + 1][0] if k + 1 < len(segments) else end
+        seg_end = max(seg_end, seg_start)
+        fixed = {i: _minutes(slots[i].get("minutes")) for i in members}
+        fixed_seconds = sum(m * 60 for m in fixed.values() if m is not None)
+        weights = {i: _weight(slots[i].get("weight", 1)) for i in members if fixed[i] is None}
+        total_weight = sum(weights.values())
+        share = max(0, seg_end - seg_start - fixed_seconds)
+        # Only the last segment may run past its end; a pin always wins
+        limit = seg_end if k + 1 < len(segments) else math.inf
+
+        t = float(seg_start)
+        for i in members:
+            starts[i] = int(t)
+            if fixed[i] is not None:
+                t += fixed[i] * 60
+            elif total_weight:
+                t += share * weights[i] / total_weight
+            t = min(t, limit)
+
+    return {"date": day.isoformat(), "starts": starts, "end": max(end, int(t))}
+
+
+def timeline_position(timeline: dict, count: int, now: float) -> tuple[int, Optional[int]]:
+    """(current index, epoch second of the next index change or None)"""
+    starts = timeline.get("starts") or []
+    if not count or len(starts) != count:
+        return 0, None
+    end = int(timeline.get("end") or starts[-1])
+    if now >= end:
+        return max(0, count - 3), None
+    pos = bisect.bisect_right(starts, now)
+    nxt = max(pos, 1)
+    return max(0, pos - 1), starts[nxt] if nxt < count else end
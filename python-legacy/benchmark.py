@@ -0,0 +1,279 @@
+"""
+Latency benchmarks for the OCR post-processing and state hot paths.
+
+Runs each benchmark on synthetic inputs (OCR text, realistic phone photos
+including HEIC, bake plans) and prints a JSON report, so results can be
+saved per commit and compared:
+
+    python benchmark.py --output before.json
+    python benchmark.py --compare before.json --threshold 1.25
+
+With --compare the script exits non-zero when any benchmark's median got
+slower than the threshold ratio.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+
+# Never talk to the real mailbox or OCR API, and keep state in memory
+os.environ["GMAIL_USER"] = ""
+os.environ["GMAIL_APP_PASSWORD"] = ""
+os.environ["STATE_BACKEND"] = "memory"
+os.environ["ROAST_HISTORY_FILE"] = ""
+
+from PIL import Image, ImageDraw, ImageFilter  # noqa: E402
+
+import app  # noqa: E402
+import image_pipeline  # noqa: E402,F401  registers the HEIF opener the photo inputs need
+from state_store import create_store  # noqa: E402
+
+# Per-call INFO logs would dominate the timings
+logging.getLogger("village-roaster").setLevel(logging.WARNING)
+
+MENU_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "menu_items.json")
+
+
+def load_menu() -> list:
+    with open(MENU_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def synthetic_ocr_text(menu: list, lines: int, rng: random.Random) -> str:
+    """OCR-looking markdown: bullets, typos, several items per line, some noise"""
+    out = ["# Bake Plan", ""]
+    for _ in range(lines):
+        names = [rng.choice(menu) for _ in range(rng.choice((1, 1, 1, 2, 3)))]
+        typo = []
+        for name in names:
+            if rng.random() < 0.3 and len(name) > 4:
+                i = rng.randrange(len(name))
+                name = name[:i] + name[i + 1 :]
+            typo.append(name.lower() if rng.random() < 0.2 else name)
+        prefix = rng.choice(("- ", "• ", "* ", "", "1. "))
+        out.append(prefix + rng.choice((", ", " / ", " | ")).join(typo))
+        if rng.random() < 0.1:
+            out.append(rng.choice(("x", "---", "Notes: call Sam", "7:30am")))
+    return "\n".join(out)
+
+
+def synthetic_photo(width: int, height: int, rng: random.Random) -> Image.Image:
+    """A photographed sheet of handwriting-ish text: gradient lighting, lines, noise"""
+    img = Image.linear_gradient("L").resize((width, height)).point(lambda v: 170 + v // 4)
+    draw = ImageDraw.Draw(img)
+    line_h = max(12, height // 40)
+    for y in range(line_h * 2, height - line_h, line_h):
+        x = width // 10
+        while x < width * 0.8:
+            w = rng.randint(width // 60, width // 12)
+            draw.rectangle([x, y, x + w, y + line_h // 2], fill=rng.randint(20, 70))
+            x += w + rng.randint(width // 100, width // 40)
+    noise = Image.effect_noise((width, height), 24)
+    img = Image.blend(img, noise, 0.15).filter(ImageFilter.GaussianBlur(1))
+    return img.convert("RGB")
+
+
+def encode(img: Image.Image, fmt: str, **params) -> bytes:
+    buf = BytesIO()
+    img.save(buf, format=fmt, **params)
+    return buf.getvalue()
+
+
+def measure(fn, repeat: int, warmup: int = 1) -> list[float]:
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def summarize(times: list[float], **extra) -> dict:
+    ordered = sorted(times)
+    return {
+        "n": len(times),
+        "mean_ms": statistics.fmean(times) * 1000,
+        "median_ms": statistics.median(times) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "min_ms": ordered[0] * 1000,
+        "ops_per_sec": len(times) / sum(times) if sum(times) else None,
+        **extra,
+    }
+
+
+def bench_text(results: dict, repeat: int, rng: random.Random):
+    menu = load_menu()
+    index = app.MenuIndex.from_items(menu)
+    for lines in (20, 80):
+        text = synthetic_ocr_text(menu, lines, rng)
+        results[f"split_candidate_lines[{lines}]"] = summarize(
+            measure(lambda: app.split_candidate_lines(text), repeat * 10)
+        )
+        candidates = app.split_candidate_lines(text)
+        results[f"fuzzy_match_to_menu[{len(candidates)}x{len(menu)}]"] = summarize(
+            measure(lambda: app.fuzzy_match_to_menu(candidates, index), repeat)
+        )
+
+
+def bench_images(results: dict, repeat: int, rng: random.Random):
+    photo = synthetic_photo(4032, 3024, rng)
+    screenshot = synthetic_photo(1170, 2532, rng)
+    inputs = {
+        "jpeg_12mp": encode(photo, "JPEG", quality=92),
+        "heic_12mp": encode(photo, "HEIF", quality=80),
+        "png_screenshot": encode(screenshot, "PNG"),
+    }
+    for name, data in inputs.items():
+        out = app.normalize_image_bytes(data, name)
+        results[f"normalize_image_bytes[{name}]"] = summarize(
+            measure(lambda: app.normalize_image_bytes(data, name), max(3, repeat // 10)),
+            bytes_in=len(data),
+            bytes_out=len(out),
+        )
+
+
+def bench_bake_window(results: dict, repeat: int):
+    for count in (12, 200):
+        items = [f"Item {i}" for i in range(count)]
+        timeline = app.compile_bake_timeline(items)
+        results[f"compile_bake_timeline[{count}]"] = summarize(
+            measure(lambda: app.compile_bake_timeline(items), repeat)
+        )
+        results[f"compute_bake_window[{count}]"] = summarize(
+            measure(lambda: app.compute_bake_window(items, timeline), repeat * 10)
+        )
+
+
+def bench_api_state(results: dict, repeat: int):
+    client = app.app.test_client()
+    client.post("/api/bake", json={"items": [f"Item {i}" for i in range(40)]})
+    client.get("/api/roast?item=Ethiopia Guji")
+    etag = client.get("/api/state").headers["ETag"]
+    results["api_state[200]"] = summarize(measure(lambda: client.get("/api/state"), repeat * 10))
+    results["api_state[304]"] = summarize(
+        measure(lambda: client.get("/api/state", headers={"If-None-Match": etag}), repeat * 10)
+    )
+
+
+def bench_save_state(results: dict, repeat: int, writers: int):
+    for backend in ("json", "sqlite"):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = create_store(
+                backend, os.path.join(tmp, "state.json"), os.path.join(tmp, "state.db")
+            )
+            state = {"roasts_today": [], "roast_current": "", "version": 0}
+            store.start(state, {})
+            times: list[float] = []
+            times_lock = threading.Lock()
+
+            def writer(n: int):
+                local = []
+                for i in range(repeat):
+                    start = time.perf_counter()
+                    with store.transaction():
+                        state["roast_current"] = f"Coffee {n}-{i}"
+                        state["roasts_today"] = (state["roasts_today"] + [state["roast_current"]])[-30:]
+                        state["version"] += 1
+                        store.save()
+                    local.append(time.perf_counter() - start)
+                with times_lock:
+                    times.extend(local)
+
+            threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+            wall = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            wall = time.perf_counter() - wall
+            store.close()
+        results[f"save_state[{backend},{writers}w]"] = summarize(
+            times, writes_per_sec=len(times) / wall if wall else None
+        )
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+def compare(results: dict, baseline_path: str, threshold: float) -> list[str]:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f).get("results", {})
+    regressions = []
+    for name, stats in results.items():
+        before = baseline.get(name)
+        if not before or not before.get("median_ms"):
+            continue
+        ratio = stats["median_ms"] / before["median_ms"]
+        stats["baseline_median_ms"] = before["median_ms"]
+        stats["ratio"] = ratio
+        if ratio > threshold:
+            regressions.append(f"{name}: {before['median_ms']:.3f}ms -> {stats['median_ms']:.3f}ms ({ratio:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR post-processing and state hot paths.")
+    parser.add_argument("--repeat", type=int, default=30, help="Base iteration count per benchmark")
+    parser.add_argument("--writers", type=int, default=4, help="Concurrent writers for save_state")
+    parser.add_argument("--only", default="", help="Comma-separated groups: text,images,bake,api,save")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="Baseline JSON report to compare medians against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown ratio that counts as a regression")
+    args = parser.parse_args()
+
+    groups = {g.strip() for g in args.only.split(",") if g.strip()}
+    rng = random.Random(args.seed)
+    results: dict = {}
+    if not groups or "text" in groups:
+        bench_text(results, args.repeat, rng)
+    if not groups or "images" in groups:
+        bench_images(results, args.repeat, rng)
+    if not groups or "bake" in groups:
+        bench_bake_window(results, args.repeat)
+    if not groups or "api" in groups:
+        bench_api_state(results, args.repeat)
+    if not groups or "save" in groups:
+        bench_save_state(results, args.repeat, args.writers)
+
+    regressions = compare(results, args.compare, args.threshold) if args.compare else []
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": results,
+        "regressions": regressions,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import json
+import os
+import secrets
+import threading
+from collections import deque
+from typing import Optional
+
+
+class Broadcaster:
+    """Fan-out of state change events to any number of SSE listeners.
+
+    Events are kept in a bounded backlog so reconnecting clients can replay
+    what they missed via Last-Event-ID. Ids are "<boot>-<seq>"; an id from a
+    previous process (or one that fell off the backlog) cannot be replayed
+    and the caller should send a full snapshot instead. The boot id is the
+    pid plus random bits, because gunicorn forks its workers within the same
+    second and each one numbers its events on its own.
+    """
+
+    def __init__(self, backlog: int = 100):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=max(1, backlog))
+        self._seq = 0
+        self.boot = f"{os.getpid():x}{secrets.token_hex(4)}"
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.boot}-{seq}"
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def publish(self, event: str, data: dict) -> int:
+        body = json.dumps(data, separators=(",", ":"))
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, event, body))
+            self._cond.notify_all()
+            return self._seq
+
+    def parse_last_id(self, last_event_id: str) -> Optional[int]:
+        """Return the sequence to replay from, or None if a snapshot is needed"""
+        boot, _, seq = (last_event_id or "").partition("-")
+        if boot != self.boot or not seq.isdigit():
+            return None
+        seq = int(seq)
+        with self._cond:
+            if seq > self._seq:
+                return None
+            oldest = self._events[0][0] if self._events else self._seq + 1
+            if seq < oldest - 1:
+                return None
+        return seq
+
+    def wait(self, seq: int, timeout: float) -> list:
+        """Block until events newer than seq exist or timeout elapses"""
+        with self._cond:
+            if self._seq <= seq:
+                self._cond.wait(timeout)
+            return [e for e in self._events if e[0] > seq]
+
+    def format(self, seq: int, event: str, body: str) -> str:
+        return f"id: {self.event_id(seq)}\nevent: {event}\ndata: {body}\n\n"
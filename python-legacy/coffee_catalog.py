@@ -0,0 +1,60 @@
+"""
+The roaster's coffee catalog (coffees.json at the repo root).
+
+One entry per coffee, in print order:
+
+    {"code": "0I", "name": "Kona 100%", "slug": "kona-100", "copies": 1}
+
+"code" is the short code the roast QR encodes (/R/<code>); it must never
+change once printed, so new coffees get a new code. "name" is what the
+sign shows, "slug" names the QR image (qr_codes/<slug>.png) and "copies" is
+how many cards of it the print sheets get. The QR generators, the print
+sheet builder and the app's /r/<code> route all read it.
+"""
+import json
+import os
+import re
+
+CATALOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "coffees.json")
+SLUG_RE = re.compile(r"^[a-z0-9][a-z0-9-]{0,63}$")
+# Digits and capitals only, so the whole short URL fits QR alphanumeric mode
+CODE_RE = re.compile(r"^[0-9A-Z]{1,8}$")
+
+
+def load_catalog(path: str = CATALOG_FILE) -> list[dict]:
+    """Validated catalog entries; raises ValueError on a malformed file"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError(f"{path}: expected a JSON list of coffees")
+
+    coffees = []
+    seen = set()
+    codes = set()
+    for i, raw in enumerate(data):
+        if not isinstance(raw, dict):
+            raise ValueError(f"{path}: entry {i} is not an object")
+        name = str(raw.get("name") or "").strip()
+        slug = str(raw.get("slug") or "").strip()
+        if not name or not SLUG_RE.match(slug):
+            raise ValueError(f"{path}: entry {i} needs a name and a lowercase slug")
+        if slug in seen:
+            raise ValueError(f"{path}: duplicate slug {slug!r}")
+        seen.add(slug)
+        code = str(raw.get("code") or "").strip().upper()
+        if not CODE_RE.match(code):
+            raise ValueError(f"{path}: {slug} needs a short code of digits and capitals")
+        if code in codes:
+            raise ValueError(f"{path}: duplicate code {code!r}")
+        codes.add(code)
+        try:
+            copies = max(0, int(raw.get("copies", 1)))
+        except (TypeError, ValueError):
+            raise ValueError(f"{path}: {slug} copies must be a number")
+        coffees.append({"code": code, "name": name, "slug": slug, "copies": copies})
+    return coffees
+
+
+def code_table(coffees: list[dict]) -> dict[str, str]:
+    """Short code -> coffee name"""
+    return {c["code"]: c["name"] for c in coffees}
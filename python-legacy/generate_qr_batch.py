@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Generate the roast QR code of every coffee in the catalog in one go.
+
+Codes are rendered on a process pool. Each output's content hash (URL plus
+render options) is kept in <output-dir>/.qr-manifest.json, and codes whose
+hash and file are unchanged are skipped, so only a base URL change or a
+new coffee costs any rendering:
+
+    python generate_qr_batch.py --base-url https://village-roaster.onrender.com
+    python generate_qr_batch.py --base-url ... --only honduras,kenya-aa --force
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from coffee_catalog import CATALOG_FILE, load_catalog
+from generate_roast_qr import RENDER_OPTIONS, render_qr, short_url
+
+MANIFEST_NAME = ".qr-manifest.json"
+
+
+def content_hash(url: str, options: dict) -> str:
+    doc = json.dumps({"url": url, "options": options}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(doc.encode("utf-8")).hexdigest()
+
+
+def load_manifest(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def save_manifest(path: str, manifest: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def render_job(job: dict) -> dict:
+    """Runs in a pool process"""
+    start = time.perf_counter()
+    render_qr(job["url"], job["output"], **job["options"])
+    return {**job, "seconds": time.perf_counter() - start}
+
+
+def plan_jobs(coffees: list[dict], base_url: str, out_dir: str, options: dict, manifest: dict, force: bool):
+    """(jobs to render, slugs that are up to date)"""
+    jobs, fresh = [], []
+    for coffee in coffees:
+        url = short_url(base_url, coffee["code"])
+        digest = content_hash(url, options)
+        output = os.path.join(out_dir, f"{coffee['slug']}.png")
+        if not force and manifest.get(coffee["slug"]) == digest and os.path.exists(output):
+            fresh.append(coffee["slug"])
+            continue
+        jobs.append({"slug": coffee["slug"], "url": url, "hash": digest, "output": output, "options": options})
+    return jobs, fresh
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate roast QR codes for every coffee in the catalog.")
+    parser.add_argument("--base-url", required=True, help="Base URL of the deployed sign")
+    parser.add_argument("--catalog", default=CATALOG_FILE, help="Coffee catalog JSON")
+    parser.add_argument("--output-dir", default="qr_codes")
+    parser.add_argument("--only", default="", help="Comma-separated slugs to (re)generate")
+    parser.add_argument("--force", action="store_true", help="Render even if the content hash is unchanged")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--box-size", type=int, default=RENDER_OPTIONS["box_size"])
+    parser.add_argument("--border", type=int, default=RENDER_OPTIONS["border"])
+    parser.add_argument(
+        "--error-correction", choices=("L", "M", "Q", "H"), default=RENDER_OPTIONS["error_correction"]
+    )
+    args = parser.parse_args()
+
+    wall = time.perf_counter()
+    coffees = load_catalog(args.catalog)
+    only = {s.strip() for s in args.only.split(",") if s.strip()}
+    if only:
+        unknown = only - {c["slug"] for c in coffees}
+        if unknown:
+            raise SystemExit(f"Unknown slugs: {', '.join(sorted(unknown))}")
+        coffees = [c for c in coffees if c["slug"] in only]
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest_path = os.path.join(args.output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    options = {"error_correction": args.error_correction, "box_size": args.box_size, "border": args.border}
+    jobs, fresh = plan_jobs(coffees, args.base_url, args.output_dir, options, manifest, args.force)
+
+    done, failed = [], []
+    if jobs:
+        workers = max(1, min(args.workers, len(jobs)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(job, pool.submit(render_job, job)) for job in jobs]
+            for job, future in futures:
+                try:
+                    done.append(future.result())
+                except Exception as exc:
+                    failed.append(job["slug"])
+                    print(f"✗ {job['slug']}: {exc}", file=sys.stderr)
+        for result in done:
+            manifest[result["slug"]] = result["hash"]
+        save_manifest(manifest_path, manifest)
+    wall = time.perf_counter() - wall
+
+    for result in done:
+        print(f"✓ {result['output']}  {result['seconds'] * 1000:6.1f}ms  {result['url']}")
+    render_total = sum(r["seconds"] for r in done)
+    print(
+        f"\n{len(done)} rendered, {len(fresh)} unchanged, {len(failed)} failed "
+        f"in {wall:.2f}s ({render_total:.2f}s of rendering)"
+    )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,59 @@
 Generate QR codes that update the roasting display via public URL.
 Usage:
     python generate_roast_qr.py --base-url https://your-app.onrender.com --roast "Honduras" --output honduras_qr.png
+
+The code encodes the coffee's short URL (/R/<code> from coffees.json).
+
+To (re)generate the whole catalog at once, use generate_qr_batch.py.
 """
 import argparse
+import urllib.parse
+
 import qrcode
-from pathlib import Path
+
+from coffee_catalog import CATALOG_FILE, load_catalog
+
+# Defaults shared with generate_qr_batch.py
+RENDER_OPTIONS = {"error_correction": "L", "box_size": 10, "border": 4}
+ERROR_CORRECTION = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+
+
+def roast_url(base_url: str, roast: str) -> str:
+    """Long form, for names that are not in the catalog"""
+    query = urllib.parse.urlencode({"item": roast}, quote_via=urllib.parse.quote)
+    return f"{base_url.rstrip('/')}/api/roast?{query}"
+
+
+def short_url(base_url: str, code: str) -> str:
+    """https://host/R/<code>, all upper case when the base URL is just a host.
+
+    Scheme and host are case-insensitive, and an upper-case URL fits QR
+    alphanumeric mode, which makes the symbol a couple of versions smaller.
+    """
+    base_url = base_url.rstrip("/")
+    parts = urllib.parse.urlsplit(base_url)
+    if parts.path or parts.query:
+        return f"{base_url}/r/{code}"
+    return f"{parts.scheme}://{parts.netloc}/R/{code}".upper()
+
+
+def render_qr(url: str, output: str, error_correction: str = "L", box_size: int = 10, border: int = 4):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=ERROR_CORRECTION[error_correction],
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    img.save(output)
 
 
 def main():
@@ -24,26 +73,20 @@ def main():
     parser.add_argument(
         "--output", default="roast_qr.png", help="Output filename for the QR code"
     )
+    parser.add_argument("--catalog", default=CATALOG_FILE, help="Coffee catalog JSON")
     args = parser.parse_args()
 
-    # Clean up base URL
-    base_url = args.base_url.rstrip("/")
-
-    # Construct the API URL
-    api_url = f"{base_url}/api/roast?item={args.roast}"
+    # Catalog coffees get the short URL; anything else needs ROAST_CATALOG_ONLY=0
+    codes = {c["name"].lower(): c["code"] for c in load_catalog(args.catalog)}
+    code = codes.get(args.roast.strip().lower())
+    if code:
+        api_url = short_url(args.base_url, code)
+    else:
+        print(f"! {args.roast} is not in {args.catalog}; the sign will reject it unless ROAST_CATALOG_ONLY=0")
+        api_url = roast_url(args.base_url, args.roast)
 
     # Generate QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(api_url)
-    qr.make(fit=True)
-
-    img = qr.make_image(fill_color="black", back_color="white")
-    img.save(args.output)
+    render_qr(api_url, args.output, **RENDER_OPTIONS)
 
     print(f"✓ QR code generated: {args.output}")
     print(f"  URL: {api_url}")
@@ -0,0 +1,31 @@
+"""
+Gunicorn hooks for the sign (picked up automatically from this directory).
+
+app.py is safe to import in the master (and with --preload): it opens no
+files and starts no threads. Each worker starts its own stores and
+background loops once it is initialised (after fork, and after gevent has
+patched the standard library when it is used), and stops them on the way out.
+
+Workers are gthread by default. Every open /api/stream display holds one of
+a worker's threads, so GUNICORN_THREADS bounds the displays per worker; with
+the plain sync worker a single display would block every other request.
+GUNICORN_WORKER_CLASS=gevent is opt-in: a display then costs a greenlet, but
+the page pool's native threads share gevent-patched locks with the hub.
+"""
+import os
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+
+def post_worker_init(worker):
+    import app
+
+    app.start_workers()
+
+
+def worker_exit(server, worker):
+    import app
+
+    app.stop_workers()
@@ -0,0 +1,185 @@
+"""
+Preprocessing for bake-plan photos before they are sent to OCR.
+
+Phone photos are often 12+ MP; OCR does not need that resolution, and
+shipping it costs upload time and model latency. The pipeline decodes at
+reduced scale where the format allows it, applies the EXIF orientation,
+downscales to IMAGE_MAX_EDGE, optionally converts to contrast-stretched
+grayscale and finally picks the highest JPEG quality that fits
+IMAGE_TARGET_BYTES. PDF pages (with the optional pypdfium2) are rendered
+straight at that size and go through the same steps.
+"""
+import logging
+import os
+import time
+from io import BytesIO
+
+import pillow_heif
+from dotenv import load_dotenv
+from PIL import Image, ImageOps
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # optional; PDF bake plans are skipped without it
+    pdfium = None
+
+load_dotenv()
+pillow_heif.register_heif_opener()
+
+logger = logging.getLogger("village-roaster")
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "2048"))
+IMAGE_GRAYSCALE = _env_flag("IMAGE_GRAYSCALE", "1")
+IMAGE_AUTOCONTRAST = _env_flag("IMAGE_AUTOCONTRAST", "1")
+IMAGE_TARGET_BYTES = int(os.getenv("IMAGE_TARGET_BYTES", "600000"))
+IMAGE_MAX_QUALITY = int(os.getenv("IMAGE_MAX_QUALITY", "85"))
+IMAGE_MIN_QUALITY = int(os.getenv("IMAGE_MIN_QUALITY", "45"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "6"))
+PDF_SUPPORT = pdfium is not None
+
+
+def _encode(img: Image.Image, quality: int) -> bytes:
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def encode_within_budget(
+    img: Image.Image,
+    target_bytes: int = IMAGE_TARGET_BYTES,
+    max_quality: int = IMAGE_MAX_QUALITY,
+    min_quality: int = IMAGE_MIN_QUALITY,
+) -> tuple[bytes, int]:
+    """Highest JPEG quality whose output fits target_bytes (binary search).
+
+    If even min_quality is too large the image is shrunk and retried, so the
+    budget is always honoured for sane targets.
+    """
+    data = _encode(img, max_quality)
+    if target_bytes <= 0 or len(data) <= target_bytes:
+        return data, max_quality
+
+    while True:
+        lo, hi = min_quality, max_quality - 1
+        best = None
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            candidate = _encode(img, mid)
+            if len(candidate) <= target_bytes:
+                best = (candidate, mid)
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        if best:
+            return best
+        if max(img.size) <= 512:
+            return _encode(img, min_quality), min_quality
+        img = img.resize(
+            (max(1, img.width * 3 // 4), max(1, img.height * 3 // 4)), Image.LANCZOS
+        )
+
+
+def prepare_ocr_image(
+    image_bytes: bytes,
+    max_edge: int = IMAGE_MAX_EDGE,
+    grayscale: bool = IMAGE_GRAYSCALE,
+    autocontrast: bool = IMAGE_AUTOCONTRAST,
+    target_bytes: int = IMAGE_TARGET_BYTES,
+) -> tuple[bytes, dict]:
+    """Return JPEG bytes ready for OCR plus a dict describing what was done"""
+    start = time.monotonic()
+    with Image.open(BytesIO(image_bytes)) as src:
+        info = {
+            "format": src.format or "unknown",
+            "mode": src.mode,
+            "width": src.width,
+            "height": src.height,
+            "bytes_in": len(image_bytes),
+        }
+        if src.format == "JPEG" and max_edge > 0:
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when that still
+            # covers max_edge; much cheaper than decoding full size
+            src.draft("L" if grayscale else "RGB", (max_edge, max_edge))
+        img = ImageOps.exif_transpose(src)
+    return _finish(img, info, start, max_edge, grayscale, autocontrast, target_bytes)
+
+
+def _finish(
+    img: Image.Image,
+    info: dict,
+    start: float,
+    max_edge: int,
+    grayscale: bool,
+    autocontrast: bool,
+    target_bytes: int,
+) -> tuple[bytes, dict]:
+    if grayscale:
+        if img.mode != "L":
+            img = img.convert("L")
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+
+    if max_edge > 0 and max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    if autocontrast:
+        img = ImageOps.autocontrast(img, cutoff=1)
+
+    data, quality = encode_within_budget(img, target_bytes)
+    info.update(
+        {
+            "width_out": img.width,
+            "height_out": img.height,
+            "bytes_out": len(data),
+            "quality": quality,
+            "seconds": time.monotonic() - start,
+        }
+    )
+    return data, info
+
+
+def prepare_pdf_pages(
+    pdf_bytes: bytes,
+    max_pages: int = PDF_MAX_PAGES,
+    max_edge: int = IMAGE_MAX_EDGE,
+    grayscale: bool = IMAGE_GRAYSCALE,
+    autocontrast: bool = IMAGE_AUTOCONTRAST,
+    target_bytes: int = IMAGE_TARGET_BYTES,
+) -> list[tuple[bytes, dict]]:
+    """OCR-ready JPEG bytes and info for the first max_pages pages of a PDF.
+
+    Pages are rasterized straight at the size OCR needs, so nothing larger
+    than max_edge is ever rendered. Requires pypdfium2.
+    """
+    if pdfium is None:
+        raise RuntimeError("PDF support needs pypdfium2 (pip install pypdfium2)")
+    pages = []
+    pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        for index in range(min(len(pdf), max(1, max_pages))):
+            start = time.monotonic()
+            page = pdf[index]
+            try:
+                width, height = page.get_size()
+                # PDF sizes are in points (1/72 in); fall back to 200 dpi
+                scale = max_edge / max(width, height, 1) if max_edge > 0 else 200 / 72
+                img = page.render(scale=scale, grayscale=grayscale).to_pil()
+            finally:
+                page.close()
+            info = {
+                "format": "PDF",
+                "mode": img.mode,
+                "width": img.width,
+                "height": img.height,
+                "bytes_in": len(pdf_bytes),
+                "page": index + 1,
+            }
+            pages.append(_finish(img, info, start, max_edge, grayscale, autocontrast, target_bytes))
+    finally:
+        pdf.close()
+    return pages
@@ -0,0 +1,411 @@
+"""
+IMAP helpers for pulling bake-plan photos without downloading whole messages.
+
+imaplib hands FETCH responses back as a flat list of byte strings and
+(prefix, literal) tuples; parse_fetch_response() turns that into per-message
+dicts, and parse_bodystructure() flattens a BODYSTRUCTURE into addressable
+MIME sections so only the chosen image part has to be downloaded.
+
+IMAPSession keeps one authenticated connection open and waits for new mail
+with IDLE (RFC 2177), falling back to NOOP polling when the server does not
+advertise it. EXISTS announcements that imaplib stashed while another command
+ran count as new mail too, since the server won't repeat them inside IDLE.
+"""
+import base64
+import binascii
+import imaplib
+import logging
+import quopri
+import random
+import re
+import select
+import ssl
+import threading
+import time
+from typing import Callable, Optional
+
+from email.header import decode_header
+
+from metrics import REGISTRY
+
+logger = logging.getLogger("village-roaster")
+
+IMAP_SECONDS = REGISTRY.histogram("sign_imap_seconds", "IMAP operation latency", ("op",))
+
+_LITERAL_RE = re.compile(rb"\{(\d+)\}$")
+_NEW_MAIL_RE = re.compile(rb"^\* \d+ (EXISTS|RECENT)\b", re.IGNORECASE)
+# How often a long IDLE wakes up to notice the stop event
+STOP_CHECK_SECONDS = 1.0
+
+
+class _Literal(bytes):
+    """Marks a token that came from an IMAP literal, never an atom/NIL"""
+
+
+def _tokenize(data) -> list:
+    tokens = []
+    for piece in data:
+        if isinstance(piece, tuple):
+            head, literal = piece[0], piece[1]
+            head = _LITERAL_RE.sub(b"", head.rstrip())
+            tokens.extend(_tokenize_text(head))
+            tokens.append(_Literal(literal or b""))
+        elif isinstance(piece, (bytes, bytearray)):
+            tokens.extend(_tokenize_text(bytes(piece)))
+    return tokens
+
+
+def _tokenize_text(text: bytes) -> list:
+    tokens = []
+    i, n = 0, len(text)
+    while i < n:
+        c = text[i : i + 1]
+        if c in (b" ", b"\r", b"\n", b"\t"):
+            i += 1
+        elif c in (b"(", b")"):
+            tokens.append(c)
+            i += 1
+        elif c == b'"':
+            i += 1
+            buf = bytearray()
+            while i < n and text[i : i + 1] != b'"':
+                if text[i : i + 1] == b"\\" and i + 1 < n:
+                    i += 1
+                buf += text[i : i + 1]
+                i += 1
+            tokens.append(_Literal(bytes(buf)))
+            i += 1
+        else:
+            start = i
+            depth = 0
+            while i < n:
+                ch = text[i : i + 1]
+                if ch == b"[":
+                    depth += 1
+                elif ch == b"]":
+                    depth -= 1
+                elif depth == 0 and ch in (b" ", b"(", b")", b"\r", b"\n"):
+                    break
+                i += 1
+            tokens.append(text[start:i])
+    return tokens
+
+
+def _parse(tokens: list, pos: int):
+    tok = tokens[pos]
+    if tok == b"(" and not isinstance(tok, _Literal):
+        out = []
+        pos += 1
+        while pos < len(tokens) and not (
+            tokens[pos] == b")" and not isinstance(tokens[pos], _Literal)
+        ):
+            value, pos = _parse(tokens, pos)
+            out.append(value)
+        return out, pos + 1
+    if not isinstance(tok, _Literal) and tok.upper() == b"NIL":
+        return None, pos + 1
+    return bytes(tok), pos + 1
+
+
+def parse_fetch_response(data) -> dict:
+    """Map message number -> {ITEM NAME: value} for an imaplib FETCH result"""
+    tokens = _tokenize(data or [])
+    out = {}
+    pos = 0
+    while pos < len(tokens):
+        tok = tokens[pos]
+        if isinstance(tok, _Literal) or not tok.isdigit():
+            pos += 1
+            continue
+        if pos + 1 >= len(tokens) or tokens[pos + 1] != b"(":
+            pos += 1
+            continue
+        items, pos = _parse(tokens, pos + 1)
+        fields = out.setdefault(tok.decode(), {})
+        for k in range(0, len(items) - 1, 2):
+            key = items[k]
+            if isinstance(key, bytes):
+                fields[key.decode("ascii", "ignore").upper()] = items[k + 1]
+    return out
+
+
+def fetch_item(fields: dict, prefix: str):
+    """First item whose name starts with prefix (servers quote field lists differently)"""
+    for key, value in fields.items():
+        if key.startswith(prefix):
+            return value
+    return None
+
+
+def _text(value) -> str:
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="ignore")
+    return ""
+
+
+def _params(value) -> dict:
+    out = {}
+    if isinstance(value, list):
+        for k in range(0, len(value) - 1, 2):
+            out[_text(value[k]).lower()] = _text(value[k + 1])
+    return out
+
+
+def _decode_words(s: str) -> str:
+    out = ""
+    for p, enc in decode_header(s):
+        if isinstance(p, bytes):
+            out += p.decode(enc or "utf-8", errors="ignore")
+        else:
+            out += p
+    return out
+
+
+def parse_bodystructure(structure, section: str = "") -> list[dict]:
+    """Flatten a parsed BODYSTRUCTURE into leaf parts with their section numbers"""
+    if not isinstance(structure, list) or not structure:
+        return []
+
+    if isinstance(structure[0], list):
+        parts = []
+        idx = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            idx += 1
+            child_section = f"{section}.{idx}" if section else str(idx)
+            parts.extend(parse_bodystructure(child, child_section))
+        return parts
+
+    ctype = f"{_text(structure[0])}/{_text(structure[1] if len(structure) > 1 else b'')}".lower()
+    params = _params(structure[2] if len(structure) > 2 else None)
+    encoding = _text(structure[5] if len(structure) > 5 else None).lower()
+    size = structure[6] if len(structure) > 6 else None
+    size = int(size) if isinstance(size, bytes) and size.isdigit() else 0
+
+    # A forwarded message: its body structure sits at index 8, and its parts
+    # are numbered under this section (N.1, N.2, ... or N.1 for a single part)
+    if ctype == "message/rfc822" and len(structure) > 8 and isinstance(structure[8], list) and structure[8]:
+        inner = structure[8]
+        base = section or "1"
+        if isinstance(inner[0], list):
+            return parse_bodystructure(inner, base)
+        return parse_bodystructure(inner, f"{base}.1")
+
+    # Disposition sits after the type-specific fields and the MD5
+    ext_start = 7
+    if ctype.startswith("text/"):
+        ext_start = 8
+    elif ctype == "message/rfc822":
+        ext_start = 10
+    disposition = ""
+    disp_params = {}
+    disp = structure[ext_start + 1] if len(structure) > ext_start + 1 else None
+    if isinstance(disp, list) and disp:
+        disposition = _text(disp[0]).lower()
+        disp_params = _params(disp[1] if len(disp) > 1 else None)
+
+    filename = disp_params.get("filename") or params.get("name") or ""
+    return [
+        {
+            "section": section or "1",
+            "content_type": ctype,
+            "encoding": encoding,
+            "size": size,
+            "disposition": disposition,
+            "filename": _decode_words(filename) if filename else "",
+        }
+    ]
+
+
+def decode_section(payload: bytes, encoding: str) -> Optional[bytes]:
+    encoding = (encoding or "").lower()
+    try:
+        if encoding == "base64":
+            return base64.b64decode(payload)
+        if encoding == "quoted-printable":
+            return quopri.decodestring(payload)
+    except (binascii.Error, ValueError):
+        return None
+    return payload
+
+
+class IMAPSession:
+    """One long-lived, logged-in IMAP connection with the mailbox selected"""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        mailbox: str = "INBOX",
+        use_ssl: bool = True,
+        idle_seconds: float = 600,
+        poll_seconds: float = 60,
+        backoff: float = 5,
+        backoff_max: float = 300,
+        factory: Optional[Callable] = None,
+        stop: Optional[threading.Event] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.mailbox = mailbox
+        self.idle_seconds = idle_seconds
+        self.poll_seconds = poll_seconds
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._factory = factory or (imaplib.IMAP4_SSL if use_ssl else imaplib.IMAP4)
+        self._stop = stop or threading.Event()
+        self._failures = 0
+        self.conn = None
+        self.supports_idle = False
+        self.exists = 0
+        self.uidvalidity = None
+
+    def connect(self):
+        logger.info("Connecting to IMAP %s:%s for %s", self.host, self.port, self.user)
+        start = time.perf_counter()
+        conn = self._factory(self.host, self.port)
+        try:
+            conn.login(self.user, self.password)
+            typ, data = conn.select(self.mailbox)
+            if typ != "OK":
+                raise imaplib.IMAP4.error(f"SELECT {self.mailbox} failed ({typ})")
+            _, validity = conn.response("UIDVALIDITY")
+            # SELECT leaves its counts stashed; the caller searches right after connecting anyway
+            self._stashed_mail(conn)
+            IMAP_SECONDS.observe(time.perf_counter() - start, op="connect")
+        except Exception:
+            self._close(conn)
+            raise
+        self.conn = conn
+        self.exists = int(data[0]) if data and data[0] and data[0].isdigit() else 0
+        self.uidvalidity = (
+            int(validity[0]) if validity and validity[0] and validity[0].isdigit() else None
+        )
+        self.supports_idle = "IDLE" in getattr(conn, "capabilities", ())
+        self._failures = 0
+        logger.info(
+            "IMAP session ready (%s)",
+            "IDLE" if self.supports_idle else f"polling every {self.poll_seconds}s",
+        )
+        return conn
+
+    def ensure(self):
+        return self.conn if self.conn is not None else self.connect()
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.logout()
+        except Exception:
+            pass
+
+    def close(self):
+        if self.conn is not None:
+            self._close(self.conn)
+            self.conn = None
+
+    def reset_after_error(self):
+        """Drop the connection and sleep with jittered exponential backoff"""
+        self.close()
+        delay = random.uniform(
+            self.backoff / 2, min(self.backoff_max, self.backoff * (2 ** self._failures))
+        )
+        self._failures += 1
+        logger.warning("IMAP reconnect #%d in %.1fs", self._failures, delay)
+        self._stop.wait(delay)
+
+    def wait_for_mail(self) -> bool:
+        """Block until the mailbox may have new mail; False on a quiet timeout or stop"""
+        conn = self.ensure()
+        if self._stashed_mail(conn):
+            return True
+        if not self.supports_idle:
+            if self._stop.wait(self.poll_seconds):
+                return False
+            conn.noop()
+            return True
+        if self._idle(conn, self.idle_seconds):
+            return True
+        if self._stop.is_set():
+            return False
+        # Nothing arrived; make sure the connection is still alive
+        conn.noop()
+        return False
+
+    def _stashed_mail(self, conn) -> bool:
+        """Pop the EXISTS/RECENT responses imaplib filed during earlier commands.
+
+        Popping them also keeps untagged_responses from growing for the
+        lifetime of the session.
+        """
+        _, exists = conn.response("EXISTS")
+        _, recent = conn.response("RECENT")
+        counts = [int(n) for n in exists if n and n.isdigit()]
+        if counts:
+            self.exists = counts[-1]
+        return bool(counts) or any(n and n.isdigit() and int(n) for n in recent)
+
+    @staticmethod
+    def _buffered(conn) -> bool:
+        """Whether a response already sits in a read buffer, where select() can't see it"""
+        sock = conn.sock
+        if getattr(sock, "pending", lambda: 0)():
+            return True
+        reader = getattr(conn, "file", None)
+        if reader is None or not hasattr(reader, "peek"):
+            return False
+        timeout = sock.gettimeout()
+        # Non-blocking, so an empty buffer doesn't wait on the socket
+        sock.settimeout(0)
+        try:
+            return bool(reader.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            sock.settimeout(timeout)
+
+    def _idle(self, conn, timeout: float) -> bool:
+        tag = conn._new_tag()
+        conn.tagged_commands.pop(tag, None)
+        conn.send(tag + b" IDLE\r\n")
+        activity = False
+        while True:
+            line = self._readline(conn)
+            if line.startswith(b"+"):
+                break
+            if line.startswith(tag):
+                raise imaplib.IMAP4.error(f"IDLE rejected: {line!r}")
+            activity = activity or bool(_NEW_MAIL_RE.match(line))
+
+        deadline = time.monotonic() + timeout
+        while not activity and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self._buffered(conn):
+                readable, _, _ = select.select([conn.sock], [], [], min(remaining, STOP_CHECK_SECONDS))
+                if not readable:
+                    continue
+            activity = bool(_NEW_MAIL_RE.match(self._readline(conn)))
+
+        conn.send(b"DONE\r\n")
+        while True:
+            line = self._readline(conn)
+            if line.startswith(tag):
+                if b" OK" not in line.upper():
+                    raise imaplib.IMAP4.error(f"IDLE ended with {line!r}")
+                break
+            activity = activity or bool(_NEW_MAIL_RE.match(line))
+        return activity
+
+    @staticmethod
+    def _readline(conn) -> bytes:
+        line = conn.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("connection closed during IDLE")
+        return line
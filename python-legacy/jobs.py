@@ -0,0 +1,149 @@
+"""
+Small in-process job queue for the email ingest pipeline.
+
+Jobs run concurrently on a fixed pool of worker threads, but their results
+are applied strictly in submission order, so a slow OCR call on an older
+message can never overwrite the plan from a newer one.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger("village-roaster")
+
+# Queued after the real jobs by close(); each worker exits when it gets one
+_STOP = object()
+
+
+class OrderedJobQueue:
+    def __init__(
+        self,
+        work: Callable[[Any, Callable[[str, float], None]], Any],
+        apply: Callable[[Any], None],
+        workers: int = 2,
+        maxsize: int = 0,
+        name: str = "ingest",
+    ):
+        self.name = name
+        self._work = work
+        self._apply = apply
+        self._queue: "queue.Queue" = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._apply_lock = threading.Lock()
+        self._next_seq = 0
+        self._next_apply = 0
+        self._done: dict = {}
+        self._in_flight = 0
+        self._counts = {"submitted": 0, "completed": 0, "failed": 0}
+        # stage -> [count, total_seconds, max_seconds]
+        self._stages: dict = {}
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, payload) -> int:
+        """Queue a job (blocks while the queue is full); returns its sequence"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"{self.name} queue is closed")
+            seq = self._next_seq
+            self._next_seq += 1
+            self._counts["submitted"] += 1
+        self._queue.put((seq, payload, time.monotonic()))
+        return seq
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            entry = self._stages.setdefault(stage, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            seq, payload, queued_at = item
+            self.record("wait", time.monotonic() - queued_at)
+            with self._lock:
+                self._in_flight += 1
+            result = None
+            ok = True
+            try:
+                result = self._work(payload, self.record)
+            except Exception:
+                ok = False
+                logger.exception("%s job %d failed", self.name, seq)
+            with self._lock:
+                self._in_flight -= 1
+                self._counts["completed" if ok else "failed"] += 1
+                self._done[seq] = result
+            self._drain()
+            self._queue.task_done()
+
+    def _drain(self):
+        with self._apply_lock:
+            while True:
+                with self._lock:
+                    if self._next_apply not in self._done:
+                        return
+                    seq = self._next_apply
+                    result = self._done.pop(seq)
+                    self._next_apply += 1
+                if result is None:
+                    continue
+                start = time.monotonic()
+                try:
+                    self._apply(result)
+                except Exception:
+                    logger.exception("%s job %d could not be applied", self.name, seq)
+                self.record("apply", time.monotonic() - start)
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """Finish the queued jobs, then stop the workers.
+
+        Returns False if some worker was still busy when timeout ran out.
+        """
+        with self._lock:
+            if self._closed:
+                return True
+            self._closed = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def remaining() -> Optional[float]:
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        try:
+            for _ in self._threads:
+                # A full queue only frees up as fast as the workers get through it
+                self._queue.put(_STOP, timeout=remaining())
+        except queue.Full:
+            return False
+        for thread in self._threads:
+            thread.join(remaining())
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "depth": self._queue.qsize(),
+                "in_flight": self._in_flight,
+                "awaiting_apply": len(self._done),
+                **self._counts,
+                "stages": {
+                    stage: {
+                        "count": count,
+                        "avg_seconds": total / count if count else None,
+                        "max_seconds": peak,
+                    }
+                    for stage, (count, total, peak) in self._stages.items()
+                },
+            }
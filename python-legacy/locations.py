@@ -0,0 +1,146 @@
+"""
+Per-location namespaces for running several signs from one app.
+
+Each location (shop) has its own state dict, StateStore (and therefore its
+own lock), change broadcaster and cached /api/state body, so traffic on one
+sign never waits on another. Locations come from a JSON object, inline
+(LOCATIONS) or on disk (LOCATIONS_FILE):
+
+    {
+      "downtown": {
+        "title": "Downtown",
+        "menu_file": "menus/downtown.json",
+        "subject_tag": "DOWNTOWN",
+        "allowed_senders": ["downtown@example.com"]
+      }
+    }
+
+Optional keys per location: "menu_items" (inline list) or "menu_file",
+"subject_tag" (routes mail whose subject contains it), "allowed_senders".
+Each location also keeps its own roast history log (roasts-<name>.log).
+Mail sent to a plus address (baking+downtown@...) routes to that location
+too. The "default" location always exists; it serves the unprefixed routes
+and owns the mailbox cursor.
+"""
+import json
+import logging
+import os
+import re
+from datetime import timezone
+from typing import Optional
+
+from broadcast import Broadcaster
+from roast_history import RoastHistory
+from state_store import StateStore
+
+logger = logging.getLogger("village-roaster")
+
+DEFAULT_LOCATION = "default"
+LOCATION_NAME_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,39}$")
+
+
+def new_state() -> dict:
+    return {
+        "date": None,
+        "roast_current": "",
+        "roasts_today": [],
+        "bake_items": [],
+        "bake_timeline": {},
+        "bake_source": "",
+        "updated_at": None,
+        "version": 0,
+    }
+
+
+def load_location_config(inline_json: str = "", path: str = "") -> dict:
+    """Location name -> config dict; always includes the default location"""
+    raw = {}
+    source = "LOCATIONS"
+    try:
+        if inline_json:
+            raw = json.loads(inline_json)
+        elif path:
+            source = path
+            with open(path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+    except Exception:
+        logger.exception("Failed to load locations from %s", source)
+        raw = {}
+    if not isinstance(raw, dict):
+        logger.warning("Ignoring locations from %s: expected a JSON object", source)
+        raw = {}
+
+    config = {}
+    for name, cfg in raw.items():
+        name = str(name).strip().lower()
+        if not LOCATION_NAME_RE.match(name):
+            logger.warning("Ignoring location with invalid name %r", name)
+            continue
+        config[name] = cfg if isinstance(cfg, dict) else {}
+    config.setdefault(DEFAULT_LOCATION, {})
+    return config
+
+
+def store_path(base: str, name: str) -> str:
+    """state.json -> state-<name>.json; the default location keeps the base path"""
+    if name == DEFAULT_LOCATION:
+        return base
+    root, ext = os.path.splitext(base)
+    return f"{root}-{name}{ext}"
+
+
+class Location:
+    def __init__(
+        self,
+        name: str,
+        store: StateStore,
+        config: Optional[dict] = None,
+        backlog: int = 100,
+        history: Optional[RoastHistory] = None,
+    ):
+        config = config or {}
+        self.name = name
+        self.config = config
+        self.title = str(config.get("title") or name)
+        self.store = store
+        self.lock = store.lock
+        self.state = new_state()
+        self.broadcaster = Broadcaster(backlog=backlog)
+        self.history = history or RoastHistory("", timezone.utc)
+        # Serialized /api/state body, rebuilt only when the version or bake index moves
+        self.body_cache = {"key": None, "body": b"", "etag": ""}
+        self.last_bake_index = {"value": None}
+        # Epoch seconds of the next daily reset; 0 until the first check
+        self.reset_deadline = 0
+
+        items = config.get("menu_items")
+        self.menu_items = json.dumps(items) if isinstance(items, list) else ""
+        self.menu_file = str(config.get("menu_file") or "").strip()
+        self.subject_tag = str(config.get("subject_tag") or "").strip().upper()
+        self.allowed_senders = [
+            str(x).strip().lower() for x in config.get("allowed_senders") or [] if str(x).strip()
+        ]
+
+    def __repr__(self) -> str:
+        return f"Location({self.name!r})"
+
+
+_PLUS_RE = re.compile(r"\+([a-z0-9_-]+)@", re.IGNORECASE)
+
+
+def route_email(locations: dict, subject: str, recipients: str = "") -> Optional[Location]:
+    """Location an ingested message belongs to.
+
+    A plus address naming a location wins, then the first location whose
+    subject_tag appears in the subject; everything else goes to the default
+    location.
+    """
+    for tag in _PLUS_RE.findall(recipients or ""):
+        loc = locations.get(tag.lower())
+        if loc is not None:
+            return loc
+    normalized = (subject or "").upper()
+    for loc in locations.values():
+        if loc.subject_tag and loc.subject_tag in normalized:
+            return loc
+    return locations.get(DEFAULT_LOCATION)
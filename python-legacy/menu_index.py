@@ -0,0 +1,157 @@
+"""
+Preprocessed menu for matching OCR lines to canonical item names.
+
+The menu comes from a JSON list, either inline (MENU_ITEMS) or on disk
+(MENU_ITEMS_FILE). Entries are plain names or objects with a "name",
+optional "aliases" and any extra fields (such as bake "minutes" or
+"weight"). Names and aliases are normalized once, the file is
+re-read only when its mtime changes, and every OCR candidate is scored in a
+single rapidfuzz cdist() call.
+"""
+import json
+import logging
+import os
+import threading
+from typing import Optional, Union
+
+from rapidfuzz import fuzz, process as rf_process, utils as rf_utils
+
+logger = logging.getLogger("village-roaster")
+
+MATCH_SCORE_CUTOFF = 80
+
+
+def _parse_entries(arr) -> list[dict]:
+    entries = []
+    if not isinstance(arr, list):
+        return entries
+    for x in arr:
+        if isinstance(x, dict):
+            name = str(x.get("name", "")).strip()
+            if not name:
+                continue
+            aliases = [str(a).strip() for a in x.get("aliases", []) if str(a).strip()]
+            entries.append({**x, "name": name, "aliases": aliases})
+        elif str(x).strip():
+            entries.append({"name": str(x).strip(), "aliases": []})
+    return entries
+
+
+class MenuIndex:
+    def __init__(self, entries: list[dict]):
+        self.entries = entries
+        self.names = [e["name"] for e in entries]
+        self._by_name = {e["name"].lower(): e for e in entries}
+        # One choice per name or alias, mapped back to the canonical name
+        self._choices: list[str] = []
+        self._owners: list[str] = []
+        self._exact: dict[str, str] = {}
+        for e in entries:
+            for label in [e["name"], *e["aliases"]]:
+                processed = rf_utils.default_process(label)
+                if not processed:
+                    continue
+                self._choices.append(processed)
+                self._owners.append(e["name"])
+                self._exact.setdefault(processed, e["name"])
+
+    @classmethod
+    def from_items(cls, items) -> "MenuIndex":
+        return cls(_parse_entries(items))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def entry(self, name: str) -> dict:
+        """Menu entry for a canonical name, with any extra fields (e.g. minutes, weight)"""
+        return self._by_name.get((name or "").lower(), {})
+
+    def match(
+        self, candidates: list[str], score_cutoff: float = MATCH_SCORE_CUTOFF
+    ) -> list[tuple[str, float]]:
+        """Best menu item for each candidate, in candidate order, deduplicated"""
+        if not candidates or not self._choices:
+            return []
+        queries = [rf_utils.default_process(c) for c in candidates]
+
+        best: list[Optional[tuple[str, float]]] = [None] * len(queries)
+        pending = []
+        for i, q in enumerate(queries):
+            name = self._exact.get(q)
+            if name is not None:
+                best[i] = (name, 100.0)
+            elif q:
+                pending.append(i)
+
+        if pending:
+            scores = rf_process.cdist(
+                [queries[i] for i in pending],
+                self._choices,
+                scorer=fuzz.WRatio,
+                processor=None,
+                score_cutoff=score_cutoff,
+                workers=-1,
+            )
+            for row, i in enumerate(pending):
+                col = int(scores[row].argmax())
+                score = float(scores[row][col])
+                if score >= score_cutoff:
+                    best[i] = (self._owners[col], score)
+
+        matched = []
+        used = set()
+        for hit in best:
+            if hit is None:
+                continue
+            key = hit[0].lower()
+            if key in used:
+                continue
+            used.add(key)
+            matched.append(hit)
+        return matched
+
+
+_cache: dict = {}
+_cache_lock = threading.Lock()
+
+
+def get_menu_index(inline_json: str = "", path: str = "") -> MenuIndex:
+    """Cached index for a menu source; file-backed menus reload on mtime change"""
+    if inline_json:
+        key = ("inline", inline_json)
+        with _cache_lock:
+            if key not in _cache:
+                try:
+                    _cache[key] = MenuIndex.from_items(json.loads(inline_json))
+                except Exception:
+                    _cache[key] = MenuIndex([])
+            index = _cache[key]
+        if len(index):
+            return index
+
+    if not path:
+        return MenuIndex([])
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return MenuIndex([])
+
+    with _cache_lock:
+        cached = _cache.get(("file", path))
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                index = MenuIndex.from_items(json.load(f))
+        except Exception:
+            logger.exception("Failed to load menu from %s", path)
+            index = cached[1] if cached else MenuIndex([])
+        _cache[("file", path)] = (mtime, index)
+        logger.info("Loaded menu index from %s (%d items)", path, len(index))
+        return index
+
+
+def as_menu_index(menu: Union["MenuIndex", list, None]) -> MenuIndex:
+    if isinstance(menu, MenuIndex):
+        return menu
+    return MenuIndex.from_items(menu or [])
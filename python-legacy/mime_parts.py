@@ -0,0 +1,145 @@
+"""
+Locate image attachments in a raw RFC 822 message without building it.
+
+email.message_from_bytes() materializes every part, and get_payload(decode=True)
+then copies the decoded image again, so a 25 MB message ends up in memory
+several times. scan_parts() instead walks the MIME tree over the raw bytes:
+only part headers are parsed (BytesHeaderParser); bodies are recorded as
+(start, end) offsets into the original buffer. The chosen image is the only
+part that ever gets decoded.
+
+rank_images() orders image parts best-first: anything big enough to be a
+photo before tiny inline images, OCR-friendly formats before the rest,
+then larger before smaller, so a signature logo never beats the photo of
+the bake plan. plan_parts() keeps every photo and PDF of a multi-page
+plan in message order. Both work on scan_parts() results and on the parts
+from imap_client.parse_bodystructure() alike.
+"""
+import re
+from email.parser import BytesHeaderParser
+from email.utils import collapse_rfc2231_value
+from typing import Optional
+
+from imap_client import decode_section
+
+# Formats the OCR model handles well; anything else only wins if it is all we have
+OCR_FRIENDLY_TYPES = {
+    "image/jpeg",
+    "image/jpg",
+    "image/pjpeg",
+    "image/png",
+    "image/heic",
+    "image/heif",
+    "image/webp",
+    "image/tiff",
+}
+# Inline images smaller than this are usually logos or tracking pixels
+MIN_IMAGE_BYTES = 10_000
+MAX_DEPTH = 10
+
+_HEADER_END_RE = re.compile(rb"\r?\n\r?\n")
+_header_parser = BytesHeaderParser()
+
+
+def _body_bounds(raw: bytes, start: int, end: int) -> tuple[int, int]:
+    """(end of headers, start of body) for the entity at raw[start:end]"""
+    if raw.startswith(b"\r\n", start) or raw.startswith(b"\n", start):
+        # No headers at all
+        return start, start + (2 if raw.startswith(b"\r\n", start) else 1)
+    m = _HEADER_END_RE.search(raw, start, end)
+    if m is None:
+        return end, end
+    return m.start(), m.end()
+
+
+def scan_parts(raw: bytes, start: int = 0, end: Optional[int] = None, section: str = "", depth: int = 0) -> list[dict]:
+    """Leaf MIME parts of raw[start:end] with their body offsets, in message order"""
+    end = len(raw) if end is None else end
+    headers_end, body_start = _body_bounds(raw, start, end)
+    headers = _header_parser.parsebytes(raw[start:headers_end])
+    ctype = headers.get_content_type()
+
+    if headers.get_content_maintype() == "multipart" and depth < MAX_DEPTH:
+        boundary = headers.get_boundary()
+        if not boundary:
+            return []
+        delimiter = re.compile(
+            rb"^--" + re.escape(boundary.encode("utf-8", "surrogateescape")) + rb"(--)?[ \t]*\r?$",
+            re.MULTILINE,
+        )
+        parts = []
+        part_start = None
+        idx = 0
+        for m in delimiter.finditer(raw, body_start, end):
+            if part_start is not None:
+                # The line break before a delimiter belongs to the delimiter
+                part_end = m.start()
+                if raw[part_end - 2 : part_end] == b"\r\n":
+                    part_end -= 2
+                elif raw[part_end - 1 : part_end] == b"\n":
+                    part_end -= 1
+                idx += 1
+                child = f"{section}.{idx}" if section else str(idx)
+                parts.extend(scan_parts(raw, part_start, max(part_start, part_end), child, depth + 1))
+            if m.group(1):
+                break
+            part_start = m.end() + (2 if raw.startswith(b"\r\n", m.end()) else 1)
+        return parts
+
+    if ctype == "message/rfc822" and depth < MAX_DEPTH:
+        return scan_parts(raw, body_start, end, section, depth + 1)
+
+    filename = headers.get_filename() or ""
+    if not filename:
+        name = headers.get_param("name")
+        filename = collapse_rfc2231_value(name) if name else ""
+    return [
+        {
+            "section": section or "1",
+            "content_type": ctype,
+            "encoding": (headers.get("Content-Transfer-Encoding") or "").strip().lower(),
+            "size": end - body_start,
+            "disposition": headers.get_content_disposition() or "",
+            "filename": filename,
+            "start": body_start,
+            "end": end,
+        }
+    ]
+
+
+def rank_images(parts: list[dict]) -> list[dict]:
+    """Image parts, best OCR candidate first"""
+    images = [p for p in parts if p["content_type"].startswith("image/")]
+    return sorted(
+        images,
+        key=lambda p: (
+            p["size"] >= MIN_IMAGE_BYTES,
+            p["content_type"] in OCR_FRIENDLY_TYPES,
+            p["size"],
+        ),
+        reverse=True,
+    )
+
+
+def is_pdf(content_type: str, filename: str = "") -> bool:
+    if content_type == "application/pdf":
+        return True
+    return content_type == "application/octet-stream" and filename.lower().endswith(".pdf")
+
+
+def plan_parts(parts: list[dict], max_parts: int = 6) -> list[dict]:
+    """Image and PDF parts that make up a bake plan, in message (page) order.
+
+    Photo-sized images all count; tiny ones only when nothing else is there.
+    """
+    images = rank_images(parts)
+    keep = [p for p in images if p["size"] >= MIN_IMAGE_BYTES] or images[:1]
+    keep_ids = {id(p) for p in keep}
+    return [
+        p for p in parts if id(p) in keep_ids or is_pdf(p["content_type"], p["filename"])
+    ][: max(1, max_parts)]
+
+
+def decode_part(raw: bytes, part: dict) -> Optional[bytes]:
+    """Decoded body of one scan_parts() entry"""
+    return decode_section(raw[part["start"] : part["end"]], part["encoding"])
@@ -0,0 +1,145 @@
+"""
+Content-addressed on-disk cache of OCR results.
+
+Entries are keyed by a hash of the OCR model, prompt and the normalized
+image bytes, so re-sent photos (forwards, re-processing after a restart)
+skip the Mistral call entirely. Eviction is LRU, bounded by total size and
+entry age.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("village-roaster")
+
+OCR_CACHE_DIR = os.getenv(
+    "OCR_CACHE_DIR", os.path.join(os.path.dirname(__file__), "ocr_cache")
+).strip()
+OCR_CACHE_MAX_MB = float(os.getenv("OCR_CACHE_MAX_MB", "50"))
+OCR_CACHE_MAX_AGE_DAYS = float(os.getenv("OCR_CACHE_MAX_AGE_DAYS", "30"))
+
+
+class OCRCache:
+    def __init__(
+        self,
+        directory: str = OCR_CACHE_DIR,
+        max_bytes: int = int(OCR_CACHE_MAX_MB * 1024 * 1024),
+        max_age_seconds: float = OCR_CACHE_MAX_AGE_DAYS * 86400,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> (size, stored_at), least recently used first
+        self._entries: "OrderedDict[str, tuple[int, float]]" = OrderedDict()
+        self._total = 0
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    @staticmethod
+    def key_for(image_bytes: bytes, model: str, prompt: str) -> str:
+        h = hashlib.sha256()
+        h.update(model.encode("utf-8"))
+        h.update(b"\0")
+        h.update(prompt.encode("utf-8"))
+        h.update(b"\0")
+        h.update(image_bytes)
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".txt")
+
+    def _scan(self):
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".txt"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            found.append((st.st_mtime, name[:-4], st.st_size))
+        for mtime, key, size in sorted(found):
+            self._entries[key] = (size, mtime)
+            self._total += size
+        with self._lock:
+            self._evict()
+        logger.info(
+            "OCR cache at %s: %d entries, %d bytes",
+            self.directory,
+            len(self._entries),
+            self._total,
+        )
+
+    def _drop(self, key: str):
+        size, _ = self._entries.pop(key)
+        self._total -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Caller must hold _lock"""
+        cutoff = time.time() - self.max_age_seconds
+        for key in [k for k, (_, stored) in self._entries.items() if stored < cutoff]:
+            self._drop(key)
+        while self._entries and self._total > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.time() - self.max_age_seconds:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    text = f.read()
+            except OSError:
+                self._entries.pop(key, None)
+                self._total -= entry[0]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key: str, text: str):
+        data = text.encode("utf-8")
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            logger.exception("Failed to write OCR cache entry %s", key)
+            return
+        with self._lock:
+            if key in self._entries:
+                self._total -= self._entries.pop(key)[0]
+            self._entries[key] = (len(data), time.time())
+            self._total += len(data)
+            self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
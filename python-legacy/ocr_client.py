@@ -0,0 +1,178 @@
+"""
+Long-lived Mistral OCR client shared by the web app and local tools.
+
+One pooled HTTP client is reused across calls so we only pay the TLS
+handshake once, every call has a timeout, transient failures are retried
+with exponential backoff and jitter, and a bounded semaphore caps how many
+requests are in flight at once.
+"""
+import base64
+import logging
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from mistralai import Mistral
+
+load_dotenv()
+
+logger = logging.getLogger("village-roaster")
+
+OCR_MODEL = os.getenv("OCR_MODEL", "pixtral-large-latest").strip()
+OCR_PROMPT = "Extract all text from this image and return it in markdown format. Include any lists, tables, or structured content you see."
+OCR_TIMEOUT_SECONDS = float(os.getenv("OCR_TIMEOUT_SECONDS", "60"))
+OCR_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OCR_CONNECT_TIMEOUT_SECONDS", "10"))
+OCR_MAX_RETRIES = int(os.getenv("OCR_MAX_RETRIES", "3"))
+OCR_BACKOFF_SECONDS = float(os.getenv("OCR_BACKOFF_SECONDS", "1"))
+OCR_BACKOFF_MAX_SECONDS = float(os.getenv("OCR_BACKOFF_MAX_SECONDS", "30"))
+OCR_MAX_IN_FLIGHT = int(os.getenv("OCR_MAX_IN_FLIGHT", "2"))
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (httpx.TimeoutException, httpx.TransportError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    return status in RETRYABLE_STATUS
+
+
+class OCRClient:
+    def __init__(
+        self,
+        api_key: str,
+        model: str = OCR_MODEL,
+        prompt: str = OCR_PROMPT,
+        timeout: float = OCR_TIMEOUT_SECONDS,
+        connect_timeout: float = OCR_CONNECT_TIMEOUT_SECONDS,
+        max_retries: int = OCR_MAX_RETRIES,
+        backoff: float = OCR_BACKOFF_SECONDS,
+        backoff_max: float = OCR_BACKOFF_MAX_SECONDS,
+        max_in_flight: int = OCR_MAX_IN_FLIGHT,
+    ):
+        if not api_key:
+            raise RuntimeError("MISTRAL_API_KEY missing")
+        self.model = model
+        self.prompt = prompt
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        max_in_flight = max(1, max_in_flight)
+        self._http = httpx.Client(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_in_flight,
+                max_keepalive_connections=max_in_flight,
+            ),
+        )
+        self._client = Mistral(
+            api_key=api_key, client=self._http, timeout_ms=int(timeout * 1000)
+        )
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "failures": 0,
+            "retries": 0,
+            "total_seconds": 0.0,
+            "max_seconds": 0.0,
+            "last_seconds": None,
+        }
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given (0-based) retry"""
+        return random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+
+    def _record(self, elapsed: float, ok: bool, retries: int):
+        with self._stats_lock:
+            s = self._stats
+            s["calls"] += 1
+            s["retries"] += retries
+            if not ok:
+                s["failures"] += 1
+            s["total_seconds"] += elapsed
+            s["max_seconds"] = max(s["max_seconds"], elapsed)
+            s["last_seconds"] = elapsed
+
+    def metrics(self) -> dict:
+        with self._stats_lock:
+            out = dict(self._stats)
+        out["avg_seconds"] = out["total_seconds"] / out["calls"] if out["calls"] else None
+        return out
+
+    def ocr_image_bytes(self, image_bytes: bytes, content_type: str = "image/jpeg") -> str:
+        b64 = base64.b64encode(image_bytes).decode("utf-8")
+
+        # Use chat completions with vision for OCR
+        data_uri = f"data:{content_type};base64,{b64}"
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": self.prompt},
+                    {"type": "image_url", "image_url": data_uri},
+                ],
+            }
+        ]
+
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                with self._slots:
+                    resp = self._client.chat.complete(model=self.model, messages=messages)
+                break
+            except Exception as exc:
+                if attempt >= self.max_retries or not is_retryable(exc):
+                    elapsed = time.monotonic() - start
+                    self._record(elapsed, False, attempt)
+                    logger.warning(
+                        "OCR call failed after %.2fs (%d attempts): %s",
+                        elapsed,
+                        attempt + 1,
+                        exc,
+                    )
+                    raise
+                delay = self.backoff_delay(attempt)
+                attempt += 1
+                logger.warning(
+                    "OCR attempt %d failed (%s), retrying in %.1fs", attempt, exc, delay
+                )
+                time.sleep(delay)
+
+        elapsed = time.monotonic() - start
+        self._record(elapsed, True, attempt)
+        logger.info(
+            "OCR call finished in %.2fs (%d bytes, %d attempts)",
+            elapsed,
+            len(image_bytes),
+            attempt + 1,
+        )
+
+        if hasattr(resp, "choices") and resp.choices:
+            return resp.choices[0].message.content or ""
+        return ""
+
+    def close(self):
+        self._http.close()
+
+
+_shared: Optional[OCRClient] = None
+_shared_key = ""
+_shared_lock = threading.Lock()
+
+
+def get_client(api_key: str) -> OCRClient:
+    """Process-wide client, rebuilt only if the API key changes"""
+    global _shared, _shared_key
+    with _shared_lock:
+        if _shared is None or _shared_key != api_key:
+            if _shared is not None:
+                _shared.close()
+            _shared = OCRClient(api_key)
+            _shared_key = api_key
+        return _shared
@@ -1,11 +1,11 @@
 import argparse
-import base64
 import os
 from pathlib import Path
 
-from mistralai import Mistral
 from dotenv import load_dotenv
 
+from ocr_client import OCRClient
+
 load_dotenv()
 
 
@@ -29,30 +29,14 @@ def main():
     if not image_path.exists():
         raise SystemExit(f"Image not found: {image_path}")
 
-    payload = base64.b64encode(image_path.read_bytes()).decode("utf-8")
-    client = Mistral(api_key=api_key)
-
-    # Use chat completions with vision for OCR
-    data_uri = f"data:image/jpeg;base64,{payload}"
-    messages = [
-        {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": "Extract all text from this image and return it in markdown format. Include any lists, tables, or structured content you see."},
-                {"type": "image_url", "image_url": data_uri}
-            ]
-        }
-    ]
-
-    resp = client.chat.complete(
-        model="pixtral-large-latest",
-        messages=messages
-    )
+    client = OCRClient(api_key)
+    try:
+        print(client.ocr_image_bytes(image_path.read_bytes()))
+    finally:
+        client.close()
 
-    if hasattr(resp, "choices") and resp.choices:
-        print(resp.choices[0].message.content)
-    else:
-        print(resp)
+    stats = client.metrics()
+    print(f"\n[ocr] {stats['last_seconds']:.2f}s, {stats['retries']} retries")
 
 
 if __name__ == "__main__":
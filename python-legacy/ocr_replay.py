@@ -0,0 +1,233 @@
+"""
+Replay recorded bake-plan photos through the ingest pipeline offline.
+
+The directory holds photos (JPG/PNG/HEIC) and, next to each one:
+
+    plan1.heic
+    plan1.expected.json   # ["Brownie", "Bacon Burrito", ...]
+    plan1.ocr.md          # recorded OCR response (stub mode)
+
+Every photo goes through normalize_image_bytes -> OCR ->
+split_candidate_lines -> fuzzy_match_to_menu on a thread pool. OCR comes
+from the recorded responses (--ocr stub, the default, with optional
+simulated latency) or the live Mistral API (--ocr live; add --record to
+save the responses for later stub runs). The report covers plan accuracy,
+per-stage latency and throughput:
+
+    python ocr_replay.py samples/ --workers 4 --stub-latency 2.5
+    python ocr_replay.py samples/ --ocr live --record
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Replays never touch the mailbox or the sign's persisted state
+os.environ["GMAIL_USER"] = ""
+os.environ["GMAIL_APP_PASSWORD"] = ""
+os.environ["STATE_BACKEND"] = "memory"
+os.environ["ROAST_HISTORY_FILE"] = ""
+
+import app  # noqa: E402
+
+logging.getLogger("village-roaster").setLevel(logging.WARNING)
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".heic", ".heif", ".webp"}
+STAGES = ("read", "normalize", "ocr", "match")
+DEFAULT_MENU = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "menu_items.json")
+
+
+def find_samples(directory: Path) -> list[Path]:
+    return sorted(p for p in directory.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+
+
+def sidecar(photo: Path, suffix: str) -> Path:
+    return photo.with_name(photo.stem + suffix)
+
+
+def load_expected(photo: Path):
+    path = sidecar(photo, ".expected.json")
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("items", []) if isinstance(data, dict) else data
+
+
+def score_plan(plan: list[str], expected: list[str]) -> dict:
+    got = [p.lower() for p in plan]
+    want = [e.lower() for e in expected]
+    hits = len(set(got) & set(want))
+    precision = hits / len(set(got)) if got else (1.0 if not want else 0.0)
+    recall = hits / len(set(want)) if want else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "exact": got == want,
+        "missing": [e for e in expected if e.lower() not in got],
+        "extra": [p for p in plan if p.lower() not in want],
+    }
+
+
+class StubOCR:
+    """Recorded responses, optionally delayed to mimic the API"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def __call__(self, photo: Path, image_bytes: bytes) -> str:
+        path = sidecar(photo, ".ocr.md")
+        if not path.exists():
+            raise FileNotFoundError(f"No recorded OCR response {path.name}; run once with --ocr live --record")
+        if self.latency:
+            time.sleep(self.latency)
+        return path.read_text(encoding="utf-8")
+
+
+class LiveOCR:
+    def __init__(self, record: bool = False):
+        self.record = record
+
+    def __call__(self, photo: Path, image_bytes: bytes) -> str:
+        text = app.mistral_ocr_image_bytes(image_bytes)
+        if self.record:
+            sidecar(photo, ".ocr.md").write_text(text, encoding="utf-8")
+        return text
+
+
+def replay_one(photo: Path, ocr, menu) -> dict:
+    timings = {}
+    start = time.perf_counter()
+    raw = photo.read_bytes()
+    timings["read"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    img_bytes = app.normalize_image_bytes(raw, photo.name)
+    timings["normalize"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        text = ocr(photo, img_bytes)
+    except Exception as exc:
+        return {"photo": photo.name, "error": f"{type(exc).__name__}: {exc}", "timings": timings}
+    timings["ocr"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    plan = app.fuzzy_match_to_menu(app.split_candidate_lines(text), menu)
+    timings["match"] = time.perf_counter() - start
+
+    result = {
+        "photo": photo.name,
+        "bytes_in": len(raw),
+        "bytes_out": len(img_bytes),
+        "plan": plan,
+        "timings": timings,
+    }
+    expected = load_expected(photo)
+    if expected is not None:
+        result["score"] = score_plan(plan, expected)
+    return result
+
+
+def stage_summary(results: list[dict]) -> dict:
+    summary = {}
+    for stage in STAGES:
+        times = sorted(r["timings"][stage] for r in results if stage in r["timings"])
+        if not times:
+            continue
+        summary[stage] = {
+            "n": len(times),
+            "median_ms": statistics.median(times) * 1000,
+            "p95_ms": times[min(len(times) - 1, int(len(times) * 0.95))] * 1000,
+            "max_ms": times[-1] * 1000,
+            "total_s": sum(times),
+        }
+    return summary
+
+
+def accuracy_summary(results: list[dict]) -> dict:
+    scored = [r["score"] for r in results if "score" in r]
+    if not scored:
+        return {"scored": 0}
+    return {
+        "scored": len(scored),
+        "exact": sum(1 for s in scored if s["exact"]),
+        "mean_precision": statistics.fmean(s["precision"] for s in scored),
+        "mean_recall": statistics.fmean(s["recall"] for s in scored),
+        "mean_f1": statistics.fmean(s["f1"] for s in scored),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded bake-plan photos through normalize, OCR and matching.")
+    parser.add_argument("directory", help="Directory of photos with .expected.json / .ocr.md sidecars")
+    parser.add_argument("--ocr", choices=("stub", "live"), default="stub", help="Recorded responses or the live API")
+    parser.add_argument("--record", action="store_true", help="With --ocr live, save responses as .ocr.md")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Seconds each stub OCR call takes")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--menu", default=app.MENU_ITEMS_FILE or DEFAULT_MENU, help="Menu JSON file")
+    parser.add_argument("--json", dest="json_path", help="Write the full report here")
+    args = parser.parse_args()
+
+    directory = Path(args.directory)
+    if not directory.is_dir():
+        raise SystemExit(f"Not a directory: {directory}")
+    photos = find_samples(directory)
+    if not photos:
+        raise SystemExit(f"No photos found in {directory}")
+    if args.ocr == "live" and not app.MISTRAL_API_KEY:
+        raise SystemExit("MISTRAL_API_KEY not set; use --ocr stub or export it.")
+
+    menu = app.get_menu_index(path=args.menu)
+    ocr = LiveOCR(args.record) if args.ocr == "live" else StubOCR(args.stub_latency)
+
+    wall = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        results = list(pool.map(lambda p: replay_one(p, ocr, menu), photos))
+    wall = time.perf_counter() - wall
+
+    report = {
+        "photos": len(photos),
+        "errors": sum(1 for r in results if "error" in r),
+        "ocr": args.ocr,
+        "workers": args.workers,
+        "wall_seconds": wall,
+        "throughput_per_min": len(photos) / wall * 60 if wall else None,
+        "accuracy": accuracy_summary(results),
+        "stages": stage_summary(results),
+        "results": results,
+    }
+
+    for r in results:
+        if "error" in r:
+            print(f"{r['photo']:32s} ERROR {r['error']}")
+            continue
+        score = r.get("score")
+        detail = f"f1={score['f1']:.2f} missing={score['missing']} extra={score['extra']}" if score else "no expected plan"
+        print(f"{r['photo']:32s} {len(r['plan']):3d} items  {detail}")
+    print()
+    for stage, s in report["stages"].items():
+        print(f"{stage:10s} median {s['median_ms']:9.1f}ms  p95 {s['p95_ms']:9.1f}ms  max {s['max_ms']:9.1f}ms")
+    acc = report["accuracy"]
+    if acc["scored"]:
+        print(
+            f"\naccuracy: {acc['exact']}/{acc['scored']} exact, mean F1 {acc['mean_f1']:.3f} "
+            f"(precision {acc['mean_precision']:.3f}, recall {acc['mean_recall']:.3f})"
+        )
+    print(f"throughput: {len(photos)} photos in {wall:.2f}s ({report['throughput_per_min']:.1f}/min, {args.workers} workers)")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if report["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
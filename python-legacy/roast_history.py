@@ -0,0 +1,258 @@
+"""
+Append-only roast history.
+
+Every roast is one fixed-size record in <path>: a little-endian uint32
+epoch second and a uint16 coffee id, 6 bytes in all. Coffee names are kept
+once each in <path>.names (one JSON string per line, the line number is
+the id), so months of roasting stay a few hundred kilobytes.
+
+The log is indexed once at startup and incrementally afterwards: per local
+day, the byte range of its records and a count per coffee. Count queries
+sum the per-day counters; event queries read only the byte range of the
+requested days. The last events of today are also kept in a ring buffer,
+which answers "today" without touching the disk.
+
+Several worker processes may append to the same log. Records are written
+with a single O_APPEND write, and a process picks up the others' records
+(and names) when it next queries.
+"""
+import bisect
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from collections import Counter, deque
+from datetime import date, datetime, time as dtime, timedelta, tzinfo
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process only
+    fcntl = None
+
+logger = logging.getLogger("village-roaster")
+
+RECORD = struct.Struct("<IH")
+MAX_COFFEES = 2 ** 16
+
+
+class RoastHistory:
+    def __init__(self, path: str, tz: tzinfo, ring_size: int = 30):
+        """path="" keeps the log in memory (tests, benchmarks)"""
+        self.path = path
+        self.names_path = path + ".names" if path else ""
+        self.tz = tz
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._fd = None
+        self._names: list[str] = []
+        self._ids: dict[str, int] = {}
+        self._indexed = 0
+        # Sorted day keys and, per day, [first offset, end offset, Counter of ids]
+        self._days: list[str] = []
+        self._day_index: dict[str, list] = {}
+        self._today = ""
+        self._ring: deque = deque(maxlen=max(1, ring_size))
+
+    def open(self):
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        start = time.perf_counter()
+        with self._lock:
+            self._load_names()
+            self._catch_up()
+        logger.info(
+            "Indexed %d roasts over %d days from %s in %.1fms",
+            self._indexed // RECORD.size,
+            len(self._days),
+            self.path or "memory",
+            (time.perf_counter() - start) * 1000,
+        )
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    # Writing
+
+    def append(self, coffee: str, ts: Optional[float] = None):
+        """Record one roast: a single small write, indexing happens on the next query"""
+        coffee = coffee.strip()
+        if not coffee:
+            return
+        record = RECORD.pack(int(ts if ts is not None else time.time()), self._coffee_id(coffee))
+        if self._fd is None:
+            with self._lock:
+                self._buffer += record
+        else:
+            os.write(self._fd, record)
+
+    def _coffee_id(self, coffee: str) -> int:
+        cid = self._ids.get(coffee)
+        if cid is not None:
+            return cid
+        with self._lock:
+            self._load_names()
+            cid = self._ids.get(coffee)
+            if cid is not None:
+                return cid
+            if not self.names_path:
+                return self._add_name(coffee)
+            with open(self.names_path, "a", encoding="utf-8") as f:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    # Another process may have added it while we waited
+                    self._load_names()
+                    cid = self._ids.get(coffee)
+                    if cid is None:
+                        cid = self._add_name(coffee)
+                        f.write(json.dumps(coffee) + "\n")
+                        f.flush()
+                finally:
+                    if fcntl:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+            return cid
+
+    def _add_name(self, coffee: str) -> int:
+        if len(self._names) >= MAX_COFFEES:
+            raise ValueError("roast history has run out of coffee ids")
+        self._ids[coffee] = len(self._names)
+        self._names.append(coffee)
+        return self._ids[coffee]
+
+    # Indexing; callers hold self._lock
+
+    def _load_names(self):
+        if not self.names_path or not os.path.exists(self.names_path):
+            return
+        with open(self.names_path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        for line in lines[len(self._names) :]:
+            try:
+                name = json.loads(line)
+            except ValueError:
+                # Torn final line; the writer still holds the lock
+                break
+            self._ids.setdefault(name, len(self._names))
+            self._names.append(name)
+
+    def _read(self, start: int, end: int) -> bytes:
+        if self._fd is None:
+            return bytes(self._buffer[start:end])
+        return os.pread(self._fd, end - start, start)
+
+    def _size(self) -> int:
+        size = len(self._buffer) if self._fd is None else os.fstat(self._fd).st_size
+        return size - size % RECORD.size
+
+    def _catch_up(self):
+        """Index records appended since the last call"""
+        end = self._size()
+        if end <= self._indexed:
+            return
+        offset = self._indexed
+        data = self._read(offset, end)
+        day, day_lo, day_hi = "", 0, 0
+        top_id = -1
+        for ts, cid in RECORD.iter_unpack(data):
+            if not day_lo <= ts < day_hi:
+                local = datetime.fromtimestamp(ts, self.tz).date()
+                day = local.isoformat()
+                day_lo, day_hi = self._day_bounds(local, local)
+            entry = self._day_index.get(day)
+            if entry is None:
+                entry = self._day_index[day] = [offset, offset, Counter()]
+                bisect.insort(self._days, day)
+            entry[1] = offset + RECORD.size
+            entry[2][cid] += 1
+            top_id = max(top_id, cid)
+            if day > self._today:
+                self._today = day
+                self._ring.clear()
+            if day == self._today:
+                self._ring.append((ts, cid))
+            offset += RECORD.size
+        self._indexed = end
+        if top_id >= len(self._names):
+            # Another process named a new coffee
+            self._load_names()
+
+    def _day_bounds(self, start: date, end: date) -> tuple[float, float]:
+        """Epoch seconds from the start of day start to the end of day end"""
+        lo = datetime.combine(start, dtime(), tzinfo=self.tz).timestamp()
+        hi = datetime.combine(end + timedelta(days=1), dtime(), tzinfo=self.tz).timestamp()
+        return lo, hi
+
+    def _day_range(self, start: date, end: date) -> list[str]:
+        lo = bisect.bisect_left(self._days, start.isoformat())
+        hi = bisect.bisect_right(self._days, end.isoformat())
+        return self._days[lo:hi]
+
+    # Queries
+
+    def counts(self, start: date, end: date, coffee: str = "") -> dict:
+        """Roasts per day and per coffee for the days start..end inclusive"""
+        with self._lock:
+            self._catch_up()
+            cid = self._ids.get(coffee) if coffee else None
+            per_day = []
+            totals: Counter = Counter()
+            for day in self._day_range(start, end):
+                counter = self._day_index[day][2]
+                if coffee:
+                    n = counter.get(cid, 0) if cid is not None else 0
+                    if n:
+                        totals[cid] += n
+                else:
+                    n = sum(counter.values())
+                    totals.update(counter)
+                if n:
+                    per_day.append({"date": day, "count": n})
+            names = self._names
+            return {
+                "days": per_day,
+                "coffees": {names[i]: n for i, n in totals.most_common()},
+                "total": sum(totals.values()),
+            }
+
+    def events(self, start: date, end: date, coffee: str = "", limit: int = 1000) -> list[dict]:
+        """Individual roasts for the days start..end inclusive, oldest first, at most limit"""
+        with self._lock:
+            self._catch_up()
+            cid = self._ids.get(coffee) if coffee else None
+            if coffee and cid is None:
+                return []
+            days = self._day_range(start, end)
+            if not days:
+                return []
+            if days == [self._today] and len(self._ring) == sum(self._day_index[self._today][2].values()):
+                records = list(self._ring)
+            else:
+                first = min(self._day_index[d][0] for d in days)
+                last = max(self._day_index[d][1] for d in days)
+                lo, hi = self._day_bounds(start, end)
+                records = [(ts, i) for ts, i in RECORD.iter_unpack(self._read(first, last)) if lo <= ts < hi]
+            names = self._names
+        out = []
+        for ts, i in records:
+            if cid is not None and i != cid:
+                continue
+            out.append({"at": datetime.fromtimestamp(ts, self.tz).isoformat(), "item": names[i]})
+            if len(out) >= limit:
+                break
+        return out
+
+    def describe(self) -> dict:
+        with self._lock:
+            return {
+                "path": self.path or "memory",
+                "roasts": self._indexed // RECORD.size,
+                "days": len(self._days),
+                "coffees": len(self._names),
+            }
@@ -0,0 +1,165 @@
+"""
+Crash-safe persistence for state.json.
+
+Instead of rewriting the whole file on every change, save points append a
+compact record of the top-level keys that changed to <state>.journal. A
+background thread fsyncs the journal in batches and periodically compacts
+it into a fresh snapshot (written to a temp file and renamed into place).
+On startup the snapshot is loaded and newer journal records replayed; a
+torn final record from a crash is ignored.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger("village-roaster")
+
+
+def _encode(value) -> str:
+    return json.dumps(value, separators=(",", ":"), sort_keys=True)
+
+
+class StateJournal:
+    def __init__(self, path: str, fsync_seconds: float = 0.5, compact_records: int = 500):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.fsync_seconds = fsync_seconds
+        self.compact_records = max(1, compact_records)
+        self.seq = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._dirty = False
+        self._since_snapshot = 0
+        self._snapshot_fn: Optional[Callable[[], dict]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # section -> key -> last journaled encoding, used to diff save points
+        self._last: dict = {"s": {}, "m": {}}
+
+    def load(self) -> dict:
+        """Snapshot with any newer journal records applied"""
+        doc = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+        seq = int(doc.get("journal_seq") or 0)
+        replayed = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        logger.warning("Ignoring torn record at end of %s", self.journal_path)
+                        break
+                    if int(rec.get("n") or 0) <= seq:
+                        continue
+                    doc.setdefault("state", {}).update(rec.get("s", {}))
+                    doc.setdefault("mail_state", {}).update(rec.get("m", {}))
+                    seq = int(rec["n"])
+                    replayed += 1
+        if replayed:
+            logger.info("Replayed %d journal records from %s", replayed, self.journal_path)
+        self.seq = seq
+        self._since_snapshot = replayed
+        return doc
+
+    def start(self, snapshot_fn: Callable[[], dict], state: dict, mail_state: dict):
+        """Begin journaling; snapshot_fn must return a consistent full document"""
+        self._snapshot_fn = snapshot_fn
+        self._prime(state, mail_state)
+        self._file = open(self.journal_path, "a", encoding="utf-8")
+        if self._since_snapshot:
+            self.compact()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name="state-journal", daemon=True)
+        self._thread.start()
+
+    def _prime(self, state: dict, mail_state: dict):
+        self._last = {
+            "s": {k: _encode(v) for k, v in state.items()},
+            "m": {k: _encode(v) for k, v in mail_state.items()},
+        }
+
+    def record(self, state: dict, mail_state: dict):
+        """Journal the top-level keys that changed; caller must hold the state lock"""
+        changes = {}
+        for section, data in (("s", state), ("m", mail_state)):
+            last = self._last[section]
+            diff = {}
+            for key, value in data.items():
+                enc = _encode(value)
+                if last.get(key) != enc:
+                    last[key] = enc
+                    diff[key] = value
+            if diff:
+                changes[section] = diff
+        if not changes:
+            return
+        with self._lock:
+            self.seq += 1
+            changes["n"] = self.seq
+            line = json.dumps(changes, separators=(",", ":")) + "\n"
+            if self._file is None:
+                logger.warning("State journal not started; dropping record %d", self.seq)
+                return
+            self._file.write(line)
+            self._dirty = True
+            self._since_snapshot += 1
+
+    def flush(self):
+        with self._lock:
+            if self._file is None or not self._dirty:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+
+    def compact(self):
+        """Write a full snapshot atomically and drop journal records it covers"""
+        if self._snapshot_fn is None:
+            return
+        start = time.monotonic()
+        doc = self._snapshot_fn()
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(doc, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        with self._lock:
+            # Records newer than the snapshot stay; replay skips the rest by seq
+            if self.seq == doc.get("journal_seq") and self._file is not None:
+                self._file.close()
+                self._file = open(self.journal_path, "w", encoding="utf-8")
+                self._dirty = False
+            self._since_snapshot = self.seq - int(doc.get("journal_seq") or 0)
+        logger.debug("Compacted state snapshot in %.1fms", (time.monotonic() - start) * 1000)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.fsync_seconds):
+            try:
+                self.flush()
+                if self._since_snapshot >= self.compact_records:
+                    self.compact()
+            except Exception:
+                logger.exception("State journal flush failed")
+
+    def close(self):
+        """Stop the flush thread, write a final snapshot and close the journal"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        try:
+            self.flush()
+            self.compact()
+        except Exception:
+            logger.exception("Failed to write final state snapshot")
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
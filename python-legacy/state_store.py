@@ -0,0 +1,304 @@
+"""
+Pluggable storage for the sign state.
+
+The app keeps two flat dicts in memory (state and mail_state). A StateStore
+decides how they are persisted and shared:
+
+- JSONStateStore: the single-process behaviour; state.json plus its
+  write-ahead journal. Use with one gunicorn worker.
+- SQLiteStateStore: one row per top-level key in a WAL-mode database, so
+  several workers (or hosts sharing a volume) see the same state. Writers
+  serialize on BEGIN IMMEDIATE, every worker notices other processes'
+  commits via PRAGMA data_version, and a lease table lets exactly one of
+  them run the email ingest loop.
+
+Mutations go through `with store.transaction():`, which pulls in changes
+from other processes first so read-modify-write updates stay atomic.
+Pure reads only need `store.lock`.
+"""
+import copy
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from state_journal import StateJournal
+
+logger = logging.getLogger("village-roaster")
+
+
+def _encode(value) -> str:
+    return json.dumps(value, separators=(",", ":"), sort_keys=True)
+
+
+class StateStore:
+    """Base class; on its own it is a purely in-memory, single-process store"""
+
+    multi_process = False
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.state: dict = {}
+        self.mail_state: dict = {}
+        self._on_change: Optional[Callable[[set], None]] = None
+
+    def load(self) -> dict:
+        """Persisted {"state": ..., "mail_state": ...} document, possibly empty"""
+        return {}
+
+    def start(self, state: dict, mail_state: dict, on_change: Optional[Callable[[set], None]] = None):
+        """Bind the live dicts; on_change(keys) fires when another process changes them"""
+        self.state = state
+        self.mail_state = mail_state
+        self._on_change = on_change
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            yield
+
+    def save(self):
+        """Persist whatever changed in the bound dicts; caller holds a transaction"""
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        return True
+
+    def release_lease(self, name: str, owner: str):
+        pass
+
+    def close(self):
+        pass
+
+    def describe(self) -> dict:
+        return {"backend": type(self).__name__}
+
+
+class JSONStateStore(StateStore):
+    def __init__(self, path: str, fsync_seconds: float = 0.5, compact_records: int = 500):
+        super().__init__()
+        self.journal = StateJournal(
+            path, fsync_seconds=fsync_seconds, compact_records=compact_records
+        )
+
+    def load(self) -> dict:
+        return self.journal.load()
+
+    def _snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "state": copy.deepcopy(self.state),
+                "mail_state": dict(self.mail_state),
+                "journal_seq": self.journal.seq,
+            }
+
+    def start(self, state, mail_state, on_change=None):
+        super().start(state, mail_state, on_change)
+        self.journal.start(self._snapshot, state, mail_state)
+
+    def save(self):
+        self.journal.record(self.state, self.mail_state)
+
+    def close(self):
+        self.journal.close()
+
+    def describe(self) -> dict:
+        return {"backend": "json", "path": self.journal.path, "journal_seq": self.journal.seq}
+
+
+class SQLiteStateStore(StateStore):
+    multi_process = True
+
+    def __init__(self, path: str, notify_seconds: float = 0.5, busy_timeout_ms: int = 10000):
+        super().__init__()
+        self.path = path
+        self.notify_seconds = notify_seconds
+        self._busy_timeout_ms = busy_timeout_ms
+        self._conn = self._connect()
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS kv (
+                section TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                rev INTEGER NOT NULL,
+                PRIMARY KEY (section, key)
+            );
+            CREATE INDEX IF NOT EXISTS kv_rev ON kv (rev);
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            """
+        )
+        self._rev = 0
+        # (section, key) -> last encoding seen in or written to the database
+        self._known: dict = {}
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False, timeout=self._busy_timeout_ms / 1000
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self._busy_timeout_ms)}")
+        return conn
+
+    def load(self) -> dict:
+        doc = {"state": {}, "mail_state": {}}
+        with self.lock:
+            for section, key, value, rev in self._conn.execute(
+                "SELECT section, key, value, rev FROM kv"
+            ):
+                doc.setdefault(section, {})[key] = json.loads(value)
+                self._known[(section, key)] = value
+                self._rev = max(self._rev, rev)
+        return doc
+
+    def start(self, state, mail_state, on_change=None):
+        super().start(state, mail_state, on_change)
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch_loop, name="state-watch", daemon=True)
+        self._watcher.start()
+
+    def _pull(self) -> set:
+        """Apply rows committed by other processes; caller holds lock"""
+        changed = set()
+        for section, key, value, rev in self._conn.execute(
+            "SELECT section, key, value, rev FROM kv WHERE rev > ? ORDER BY rev", (self._rev,)
+        ):
+            self._rev = max(self._rev, rev)
+            if self._known.get((section, key)) == value:
+                continue
+            self._known[(section, key)] = value
+            target = self.state if section == "state" else self.mail_state
+            target[key] = json.loads(value)
+            if section == "state":
+                changed.add(key)
+        return changed
+
+    def _notify(self, changed: set):
+        if changed and self._on_change:
+            try:
+                self._on_change(changed)
+            except Exception:
+                logger.exception("State change callback failed")
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._notify(self._pull())
+                yield
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                # Local dicts may hold uncommitted edits; re-read everything
+                self._rev = 0
+                self._known.clear()
+                self._pull()
+                raise
+
+    def save(self):
+        rows = []
+        for section, data in (("state", self.state), ("mail_state", self.mail_state)):
+            for key, value in data.items():
+                enc = _encode(value)
+                if self._known.get((section, key)) != enc:
+                    rows.append((section, key, enc))
+        if not rows:
+            return
+        (rev,) = self._conn.execute("SELECT COALESCE(MAX(rev), 0) FROM kv").fetchone()
+        for section, key, enc in rows:
+            rev += 1
+            self._conn.execute(
+                "INSERT INTO kv (section, key, value, rev) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (section, key) DO UPDATE SET value = excluded.value, rev = excluded.rev",
+                (section, key, enc, rev),
+            )
+            self._known[(section, key)] = enc
+        self._rev = max(self._rev, rev)
+
+    def _watch_loop(self):
+        reader = self._connect()
+        try:
+            self._watch(reader)
+        finally:
+            reader.close()
+
+    def _watch(self, reader: sqlite3.Connection):
+        (last,) = reader.execute("PRAGMA data_version").fetchone()
+        while not self._stop.wait(self.notify_seconds):
+            try:
+                (version,) = reader.execute("PRAGMA data_version").fetchone()
+                if version == last:
+                    continue
+                last = version
+                with self.lock:
+                    self._notify(self._pull())
+            except Exception:
+                logger.exception("State watch loop failed")
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self.lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT owner, expires_at FROM leases WHERE name = ?", (name,)
+                ).fetchone()
+                held = row is None or row[0] == owner or row[1] < now
+                if held:
+                    self._conn.execute(
+                        "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at",
+                        (name, owner, now + ttl),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return held
+
+    def release_lease(self, name: str, owner: str):
+        with self.lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def close(self):
+        self._stop.set()
+        if self._watcher is not None and self._watcher is not threading.current_thread():
+            self._watcher.join()
+        self._watcher = None
+        with self.lock:
+            self._conn.close()
+
+    def describe(self) -> dict:
+        with self.lock:
+            leases = {
+                name: {"owner": owner, "expires_in": round(expires_at - time.time(), 1)}
+                for name, owner, expires_at in self._conn.execute(
+                    "SELECT name, owner, expires_at FROM leases"
+                )
+            }
+        return {"backend": "sqlite", "path": self.path, "rev": self._rev, "leases": leases}
+
+
+def create_store(backend: str, json_path: str, sqlite_path: str, **options) -> StateStore:
+    backend = (backend or "json").strip().lower()
+    if backend == "sqlite":
+        return SQLiteStateStore(sqlite_path, notify_seconds=options.get("notify_seconds", 0.5))
+    if backend == "memory":
+        return StateStore()
+    if backend != "json":
+        raise ValueError(f"Unknown STATE_BACKEND {backend!r}")
+    return JSONStateStore(
+        json_path,
+        fsync_seconds=options.get("fsync_seconds", 0.5),
+        compact_records=options.get("compact_records", 500),
+    )
@@ -0,0 +1,27 @@
+from datetime import date, datetime, timezone
+
+from bake_timeline import compile_timeline, timeline_position
+
+DAY = date(2026, 10, 17)
+
+
+def _at(clock: str) -> int:
+    hour, minute = clock.split(":")
+    return int(datetime(DAY.year, DAY.month, DAY.day, int(hour), int(minute), tzinfo=timezone.utc).timestamp())
+
+
+def test_fixed_minutes_are_cut_short_at_the_next_pin():
+    slots = [{"minutes": 120}, {}, {"at": "08:00"}, {}]
+    timeline = compile_timeline(slots, DAY, 7, 15, timezone.utc)
+
+    assert timeline["starts"] == [_at("07:00"), _at("08:00"), _at("08:00"), _at("11:30")]
+    assert timeline_position(timeline, len(slots), _at("07:30")) == (0, _at("08:00"))
+    assert timeline_position(timeline, len(slots), _at("08:30")) == (2, _at("11:30"))
+
+
+def test_last_segment_may_run_past_the_shift_end():
+    slots = [{"at": "14:00"}, {"minutes": 120}, {}]
+    timeline = compile_timeline(slots, DAY, 7, 15, timezone.utc)
+
+    assert timeline["starts"] == sorted(timeline["starts"])
+    assert timeline["end"] == _at("16:00")
@@ -12,6 +12,32 @@ import {
 import { splitCandidateLines, fuzzyMatchToMenu, loadMenuItems } from './fuzzy';
 import { mistralOcrImageBytes, normalizeImageBytes } from './ocr';
 import { handleEmail } from './email-handler';
+import coffees from '../coffees.json';
+
+// Short roast codes (/R/<code>, what the QR codes encode) -> coffee name
+const ROAST_CODES: Map<string, string> = new Map(
+  (coffees as { code: string; name: string }[]).map((c) => [c.code.toUpperCase(), c.name])
+);
+const SHORT_CODE_PATH = /^\/r\/([0-9a-z]{1,8})\/?$/i;
+
+async function recordRoast(env: Env, item: string): Promise<void> {
+  const state = await loadState(env.KV);
+  state.date = todayKey(env.APP_TZ);
+  state.roast_current = item;
+
+  if (
+    state.roasts_today.length === 0 ||
+    state.roasts_today[state.roasts_today.length - 1] !== item
+  ) {
+    state.roasts_today.push(item);
+    const maxRoasts = parseInt(env.ROASTS_MAX || '30', 10);
+    state.roasts_today = state.roasts_today.slice(-maxRoasts);
+  }
+
+  state.updated_at = iso();
+  state.last_roast_time = iso(); // Track when we last roasted
+  await saveState(env.KV, state);
+}
 
 // HTML template for the display
 const HTML_TEMPLATE = `<!DOCTYPE html>
@@ -294,28 +320,31 @@ export default {
         );
       }
 
-      const state = await loadState(env.KV);
-      state.date = todayKey(env.APP_TZ);
-      state.roast_current = item;
-
-      if (
-        state.roasts_today.length === 0 ||
-        state.roasts_today[state.roasts_today.length - 1] !== item
-      ) {
-        state.roasts_today.push(item);
-        const maxRoasts = parseInt(env.ROASTS_MAX || '30', 10);
-        state.roasts_today = state.roasts_today.slice(-maxRoasts);
-      }
-
-      state.updated_at = iso();
-      state.last_roast_time = iso(); // Track when we last roasted
-      await saveState(env.KV, state);
+      await recordRoast(env, item);
 
       return new Response(JSON.stringify({ ok: true }), {
         headers: { 'Content-Type': 'application/json' },
       });
     }
 
+    // Short roast code from a QR scan: unknown codes never touch KV
+    const shortCode = url.pathname.match(SHORT_CODE_PATH);
+    if (shortCode) {
+      const item = ROAST_CODES.get(shortCode[1].toUpperCase());
+      if (!item) {
+        return new Response(
+          JSON.stringify({ ok: false, error: 'unknown code' }),
+          { status: 404, headers: { 'Content-Type': 'application/json' } }
+        );
+      }
+      await ensureDailyReset(env);
+      await recordRoast(env, item);
+
+      return new Response(JSON.stringify({ ok: true, item }), {
+        headers: { 'Content-Type': 'application/json' },
+      });
+    }
+
     // API: Update bake items
     if (url.pathname === '/api/bake' && request.method === 'POST') {
       await ensureDailyReset(env);